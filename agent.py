@@ -2,19 +2,46 @@ from typing import List
 import os
 import asyncio
 import uuid
-import re
+import time
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_mcp_adapters.client import MultiServerMCPClient
-from langchain_core.messages import HumanMessage, ToolMessage, SystemMessage, AIMessage
-from tools import search_local_knowledge, search_media_asset, ask_supervisor_approval, ask_installation_approval, format_application_details
+from langchain_core.messages import HumanMessage, ToolMessage, SystemMessage, AIMessage, message_chunk_to_message
+from tools import search_local_knowledge, search_media_asset, ask_supervisor_approval, ask_installation_approval, format_application_details, qa_result_cache
 from logger import logger
+from cache import LRUCache
+from config import (
+    TOOL_CALL_TIMEOUT,
+    AGENT_STREAMING,
+    STREAM_HOLDBACK_CHARS,
+    AGENT_FAST_PATH,
+    CATALOG_ENABLED,
+    DB_BACKEND,
+    CONTEXT_TOKEN_BUDGET,
+    SUMMARY_ENABLED,
+    SUMMARY_MAX_CHARS,
+    SUMMARY_MIN_MESSAGES,
+    DEEPSEEK_MODEL,
+    DEEPSEEK_BASE_URL,
+    DEEPSEEK_TEMPERATURE,
+    SCHEMA_CACHE_CAPACITY
+)
+from retrieval import open_engine
+from db import load_mysql_env, get_pool, sql_result_cache
+from catalog import get_catalog
+from mcp_session import MCPSessionPool
+from db_backend import build_db_tools, get_backend
+from router import FastPathRouter
 from session import save_session, load_session, list_sessions
+from slots import SlotTracker
+from context import build_context, message_tokens, prompt_cache_usage
+from summary import summarize, format_summary_block
 from skills.database_query.tools import (
     dbq_price_by_size_config,
     dbq_configs_by_size,
     dbq_i5_i7_price_rows,
     dbq_size_info,
+    dbq_quote,
 )
 import logging
 
@@ -24,51 +51,10 @@ VERBOSE = str(os.environ.get("AGENT_VERBOSE", "")).lower() in ("1", "true", "yes
 if not VERBOSE:
     logger.setLevel(logging.WARNING)
 
-def get_sliding_window_messages(messages, window_size=25):
-    if len(messages) <= window_size:
-        return messages
-    
-    system_message = None
-    other_messages = []
-    
-    for msg in messages:
-        if isinstance(msg, SystemMessage):
-            system_message = msg
-        else:
-            other_messages.append(msg)
-    
-    recent_messages = other_messages[-window_size:]
-    
-    if system_message:
-        return [system_message] + recent_messages
-    return recent_messages
-
-
-def extract_key_info_from_messages(messages):
-    key_info = {}
-    
-    for msg in messages:
-        if isinstance(msg, AIMessage) and "Final Answer" in msg.content:
-            content = msg.content
-            
-            size_match = re.search(r'尺寸[：:]\s*([^\n]+)', content)
-            if size_match:
-                key_info["尺寸"] = size_match.group(1).strip()
-            
-            config_match = re.search(r'配置[：:]\s*([^\n]+)', content)
-            if config_match:
-                key_info["配置"] = config_match.group(1).strip()
-            
-            price_match = re.search(r'价格[：:]\s*([^\n]+)', content)
-            if price_match:
-                key_info["价格"] = price_match.group(1).strip()
-            
-            stand_match = re.search(r'支架[：:]\s*([^\n]+)', content)
-            if stand_match:
-                key_info["支架"] = stand_match.group(1).strip()
-    
-    return key_info
+STREAMING = AGENT_STREAMING
 
+# 需要主管在终端输入批复的工具：不能并发，也不能超时
+INTERACTIVE_TOOLS = {"ask_supervisor_approval", "ask_installation_approval"}
 
 def build_system_prompt_with_key_info(static_prompt, key_info):
     if not key_info:
@@ -82,17 +68,18 @@ def build_system_prompt_with_key_info(static_prompt, key_info):
     return key_info_str + static_prompt
 
 
-def build_system_prompt_with_slots(static_prompt, slots):
-    if not slots:
-        return static_prompt
-    
-    slots_str = "【已确认的订单信息】\n"
-    for key, value in slots.items():
-        if value:
-            slots_str += f"{key}：{value}\n"
-    slots_str += "\n"
-    
-    return slots_str + static_prompt
+def build_dynamic_context(slots, summary=""):
+    """
+    每轮变化的上下文（早前对话摘要 + 已确认槽位）。单独放在静态 system prompt 之后的
+    第二条 system 消息里，保证请求前缀（工具定义 + 静态 prompt）逐字节不变，命中服务端前缀缓存。
+    """
+    content = format_summary_block(summary)
+    filled = [(key, value) for key, value in (slots or {}).items() if value]
+    if filled:
+        content += "【已确认的订单信息】\n"
+        for key, value in filled:
+            content += f"{key}：{value}\n"
+    return content.strip()
 
 
 def filter_orphan_tool_messages(msgs: List):
@@ -113,116 +100,226 @@ def filter_orphan_tool_messages(msgs: List):
     return filtered
 
 
-async def main():
-    logger.info("初始化 LLM...")
-    from collections import OrderedDict
-    class LRU:
-        def __init__(self, capacity=128):
-            self.capacity = capacity
-            self.map = OrderedDict()
-        def get(self, k):
-            if k in self.map:
-                v = self.map.pop(k)
-                self.map[k] = v
-                return v
-            return None
-        def put(self, k, v):
-            if k in self.map:
-                self.map.pop(k)
-            elif len(self.map) >= self.capacity:
-                self.map.popitem(last=False)
-            self.map[k] = v
-    sql_cache = LRU(256)
-    schema_cache = LRU(64)
-    llm = ChatOpenAI(
-        model="deepseek-chat", 
-        temperature=0,
-        base_url="https://api.deepseek.com",
-        api_key=os.environ.get("DEEPSEEK_API_KEY")
+def _tool_cache_key(tool_name, tool_args, sql_cache, schema_cache):
+    """返回该工具调用对应的 (缓存, 缓存键, 额外键参数)；不可缓存的调用返回 (None, None, None)。"""
+    if tool_name == "query" and isinstance(tool_args, dict) and "sql" in tool_args:
+        # SQLResultCache 内部规范化 SQL，并把参数化查询的 params 一起计入键
+        return sql_cache, tool_args["sql"], {"params": tool_args.get("params")}
+    if tool_name == "describe_table" and isinstance(tool_args, dict) and "table" in tool_args:
+        return schema_cache, f"desc::{tool_args['table']}", {}
+    return None, None, None
+
+
+async def run_tool_call(tool_call, tools, sql_cache, schema_cache, timeout=TOOL_CALL_TIMEOUT):
+    tool_name = tool_call["name"]
+    tool_args = tool_call["args"]
+    tool_id = tool_call["id"]
+
+    if VERBOSE:
+        logger.info(f"调用工具: {tool_name}, 参数: {tool_args}")
+        print(f"🔧 调用工具: {tool_name}")
+        print(f"   参数: {tool_args}")
+
+    start = time.perf_counter()
+    use_cache = False
+    selected_tool = next((t for t in tools if t.name == tool_name), None)
+    if selected_tool is None:
+        tool_result = f"Error: 未知工具 {tool_name}"
+    else:
+        try:
+            cache, cache_key, key_kwargs = _tool_cache_key(tool_name, tool_args, sql_cache, schema_cache)
+            cached = cache.get(cache_key, **key_kwargs) if cache is not None else None
+            if cached is not None:
+                tool_result = cached
+                use_cache = True
+            else:
+                call = selected_tool.ainvoke(tool_args)
+                tool_result = await (asyncio.wait_for(call, timeout) if timeout else call)
+                if cache is not None:
+                    cache.put(cache_key, tool_result, **key_kwargs)
+                elif tool_name == "execute" and isinstance(tool_args, dict) and "sql" in tool_args:
+                    # 写操作成功后使涉及的表失效，商品目录等监听器随之重新加载
+                    sql_cache.invalidate_sql(tool_args["sql"])
+        except asyncio.TimeoutError:
+            logger.error(f"工具执行超时: {tool_name} (>{timeout}s)")
+            tool_result = f"Error: 工具 {tool_name} 执行超时（{timeout}秒）"
+        except Exception as e:
+            logger.error(f"工具执行错误: {e}")
+            tool_result = f"Error: {e}"
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    result_str = str(tool_result)
+    display_result = result_str[:200] + "..." if len(result_str) > 200 else result_str
+    if VERBOSE:
+        logger.info(f"工具执行结果: {display_result}")
+        print(f"   {tool_name} 结果: {display_result}{' (cached)' if use_cache else ''} [{elapsed_ms:.0f}ms]\n")
+    return {"id": tool_id, "name": tool_name, "result": result_str, "cached": use_cache, "elapsed_ms": elapsed_ms}
+
+
+async def run_tool_calls(tool_calls, tools, sql_cache, schema_cache):
+    """
+    并发执行同一步中的工具调用，每个调用单独计时并受 TOOL_CALL_TIMEOUT 限制。
+    需要人工在终端输入的审批类工具不参与并发，也不设超时，在其余调用完成后依次执行。
+    返回结果顺序与 tool_calls 一致。
+    """
+    start = time.perf_counter()
+    outcomes = [None] * len(tool_calls)
+    concurrent = [i for i, tc in enumerate(tool_calls) if tc["name"] not in INTERACTIVE_TOOLS]
+    interactive = [i for i, tc in enumerate(tool_calls) if tc["name"] in INTERACTIVE_TOOLS]
+
+    results = await asyncio.gather(
+        *(run_tool_call(tool_calls[i], tools, sql_cache, schema_cache) for i in concurrent)
     )
+    for i, outcome in zip(concurrent, results):
+        outcomes[i] = outcome
+    for i in interactive:
+        outcomes[i] = await run_tool_call(tool_calls[i], tools, sql_cache, schema_cache, timeout=None)
 
-    # 会话选择
-    print("=" * 50)
-    print("欢迎使用智能对话系统")
-    print("=" * 50)
-    
-    sessions = list_sessions()
-    session_id = None
-    chat_history = None
-    key_info = {}
-    
-    if sessions:
-        print("\n可用的历史会话:")
-        for i, session in enumerate(sessions, 1):
-            print(f"{i}. {session['session_id']} (创建时间: {session['created_at']}, 消息数: {session['message_count']})")
-        print(f"{len(sessions) + 1}. 创建新会话")
-        
-        while True:
-            try:
-                choice = input("\n请选择会话编号 (回车默认创建新会话): ").strip()
-                if not choice:
-                    break
-                choice_num = int(choice)
-                if 1 <= choice_num <= len(sessions):
-                    session_id = sessions[choice_num - 1]["session_id"]
-                    break
-                elif choice_num == len(sessions) + 1:
-                    break
-                else:
-                    print("无效的选择，请重新输入")
-            except ValueError:
-                print("请输入有效的数字")
-    
-    if session_id:
-        chat_history, key_info = load_session(session_id)
-        logger.info(f"加载会话: {session_id}, 消息数: {len(chat_history)}")
-        print(f"\n已加载会话: {session_id}")
+    total_ms = (time.perf_counter() - start) * 1000
+    timings = ", ".join(f"{o['name']}={o['elapsed_ms']:.0f}ms{'(cached)' if o['cached'] else ''}" for o in outcomes)
+    logger.info(f"本步工具调用 {len(outcomes)} 个, 总耗时 {total_ms:.0f}ms: {timings}")
+    return outcomes
+
+
+async def stream_llm_response(llm_with_tools, messages, on_token=None):
+    """
+    流式调用模型：最终回答的 token 边到边交给 on_token 输出；出现 tool_call 分片后不再输出正文，
+    由调用方按工具调用处理。开头的正文先攒到 STREAM_HOLDBACK_CHARS 个字，期间出现 tool_call 就整段丢弃，
+    避免把工具调用前的中间说明当成回答发给客户（中间说明只在 VERBOSE 下由调用方打印）。
+    返回 (组装好的 AIMessage, 计时指标)，首字时间记在第一次调用 on_token 时。
+    """
+    start = time.perf_counter()
+    first_token_at = None
+    aggregated = None
+    pending = []
+    pending_chars = 0
+    saw_tool_call = False
+
+    def emit(text):
+        nonlocal first_token_at
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        if on_token:
+            on_token(text)
+
+    async for chunk in llm_with_tools.astream(messages):
+        aggregated = chunk if aggregated is None else aggregated + chunk
+        if getattr(chunk, "tool_call_chunks", None):
+            saw_tool_call = True
+            pending.clear()
+        if not chunk.content or saw_tool_call:
+            continue
+        if first_token_at is not None:
+            emit(chunk.content)
+            continue
+        pending.append(chunk.content)
+        pending_chars += len(chunk.content)
+        if pending_chars >= STREAM_HOLDBACK_CHARS:
+            emit("".join(pending))
+            pending.clear()
+    total_ms = (time.perf_counter() - start) * 1000
+
+    if aggregated is None:
+        response = AIMessage(content="")
     else:
-        session_id = str(uuid.uuid4())[:8]
-        chat_history = []
-        key_info = {}
-        logger.info(f"创建新会话: {session_id}")
-        print(f"\n创建新会话: {session_id}")
-
-    # 2. 准备 MCP Server 配置
-    # 读取 mcp-mysql-server 的环境变量文件
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    mysql_server_dir = os.path.join(base_dir, "mcp-mysql-server")
-    mysql_env_path = os.path.join(mysql_server_dir, "env")
-    
-    mysql_env = os.environ.copy()
-    if os.path.exists(mysql_env_path):
-        logger.info(f"读取 MySQL 环境变量: {mysql_env_path}")
-        with open(mysql_env_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith("#"):
-                    try:
-                        key, value = line.split("=", 1)
-                        mysql_env[key.strip()] = value.strip()
-                    except ValueError:
-                        pass
-    
-    # 构建启动命令
-    script_path = os.path.join(mysql_server_dir, "node_modules", "@fhuang", "mcp-mysql-server", "build", "index.js")
-    
-    logger.info(f"MCP Server 脚本路径: {script_path}")
-    
-    # 3. 初始化 MCP Client
-    client = MultiServerMCPClient({
-        "mysql": {
-            "command": "node",
-            "args": [script_path],
-            "transport": "stdio",
-            "env": mysql_env
+        response = message_chunk_to_message(aggregated)
+    if pending and not response.tool_calls:
+        # 回答比暂存长度还短
+        emit("".join(pending))
+    streamed = first_token_at is not None
+    if response.tool_calls:
+        # 带工具调用的中间步骤不计入首字时间
+        first_token_at = None
+    first_token_ms = (first_token_at - start) * 1000 if first_token_at is not None else None
+    metrics = {"first_token_at": first_token_at, "total_ms": total_ms, "streamed": streamed}
+    logger.info(f"LLM 调用: 首字 {f'{first_token_ms:.0f}ms' if first_token_ms is not None else '-'}, 总计 {total_ms:.0f}ms")
+    return response, metrics
+
+
+class ChatSession:
+    """单个客户会话：对话历史、槽位信息，以及保证同一会话串行处理的锁。"""
+
+    def __init__(self, session_id, chat_history, key_info, state=None):
+        self.session_id = session_id
+        self.chat_history = chat_history
+        self.key_info = key_info
+        state = state or {}
+        self.slot_tracker = SlotTracker(key_info, state.get("slot_checkpoint", 0))
+        # 滚动摘要：summary_checkpoint 之前的非 system 消息已并入 summary，不再进入上下文
+        self.summary = state.get("summary", "")
+        self.summary_checkpoint = state.get("summary_checkpoint", 0)
+        self.compaction_task = None
+        self.lock = asyncio.Lock()
+
+    def state(self):
+        return {
+            **self.slot_tracker.state(),
+            "summary": self.summary,
+            "summary_checkpoint": self.summary_checkpoint,
         }
-    })
-        
-    logger.info("连接 MCP Server 并获取工具...")
-    try:
-        mcp_tools = await client.get_tools()
-        # 合并 MCP 工具和本地工具
-        tools = mcp_tools + [
+
+    def save(self):
+        save_session(self.session_id, self.chat_history, self.key_info, self.state())
+
+
+class AgentRuntime:
+    """
+    进程级智能体运行时：LLM client、MCP 工具、SQL/表结构缓存和检索引擎只创建一份，
+    由所有会话共享；每个会话的对话历史通过各自的锁串行更新。
+    REPL（本文件 main）和 HTTP 服务（server.py）都通过它处理对话。
+    """
+
+    def __init__(self):
+        self.llm = ChatOpenAI(
+            model=DEEPSEEK_MODEL,
+            temperature=DEEPSEEK_TEMPERATURE,
+            base_url=DEEPSEEK_BASE_URL,
+            api_key=os.environ.get("DEEPSEEK_API_KEY"),
+            # 流式响应最后一个分片带上 usage，用于统计前缀缓存命中
+            stream_usage=True,
+        )
+        self.sql_cache = sql_result_cache
+        self.schema_cache = LRUCache(SCHEMA_CACHE_CAPACITY)
+        self.router = FastPathRouter(enabled=AGENT_FAST_PATH)
+        self.mcp_client = None
+        self.mcp_pool = None
+        self.db_backend = None
+        self.tools = []
+        self.llm_with_tools = None
+        self.system_prompt_content = ""
+        self.static_system_message = None
+        self.sessions = {}
+        self._sessions_lock = asyncio.Lock()
+        self._context_stats = {
+            "turns": 0, "prompt_tokens_total": 0, "prompt_tokens_last": 0, "dropped_last": 0,
+            "cache_hit_tokens_total": 0, "cache_miss_tokens_total": 0,
+        }
+
+    async def start(self):
+        logger.info("初始化 LLM...")
+
+        # 预热检索引擎：常驻的 ChromaDB client / embedding 函数供整个进程复用
+        try:
+            engine = open_engine()
+            logger.info(f"检索引擎就绪: {engine.stats()}")
+        except Exception as e:
+            logger.warning(f"检索引擎打开失败，将在首次检索时重试: {e}")
+
+        # 商品目录快照：六张商品表读入内存，价格/尺寸/配置查询不再走数据库
+        if CATALOG_ENABLED:
+            await asyncio.to_thread(get_catalog().start)
+
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        if DB_BACKEND == "mcp":
+            db_tools = await self._start_mcp(base_dir)
+        else:
+            # 进程内数据库后端：工具名和参数与 MCP 一致，不启动 Node 进程
+            self.db_backend = get_backend()
+            db_tools = build_db_tools(self.db_backend)
+            logger.info(f"使用进程内数据库后端: {self.db_backend.name}")
+
+        # 合并数据库工具和本地工具
+        self.tools = db_tools + [
             search_local_knowledge,
             search_media_asset,
             ask_supervisor_approval,
@@ -232,179 +329,385 @@ async def main():
             dbq_configs_by_size,
             dbq_i5_i7_price_rows,
             dbq_size_info,
+            dbq_quote,
         ]
-        
-        logger.info(f"成功获取 {len(tools)} 个工具: {[t.name for t in tools]}")
-        logger.info("开始运行智能体... (输入 'exit' 或 'quit' 退出)")
+        logger.info(f"成功获取 {len(self.tools)} 个工具: {[t.name for t in self.tools]}")
         
         # 读取 System Prompt
         system_prompt_path = os.path.join(base_dir, "system_prompt.txt")
         if os.path.exists(system_prompt_path):
             with open(system_prompt_path, "r", encoding="utf-8") as f:
-                system_prompt_content = f.read()
+                self.system_prompt_content = f.read()
         else:
-            system_prompt_content = "你是一个智能数据库助手。" # 默认 Prompt
+            self.system_prompt_content = "你是一个智能数据库助手。" # 默认 Prompt
+        # 每次请求复用同一条静态 system 消息；工具列表启动后不再变化，二者构成稳定的缓存前缀
+        self.static_system_message = SystemMessage(content=self.system_prompt_content)
 
-        # 如果是新会话，添加 system prompt
-        if not chat_history:
-            system_prompt = SystemMessage(content=system_prompt_content)
-            chat_history = [system_prompt]
-        else:
-            # 检查是否已有 system prompt
-            has_system_prompt = any(isinstance(msg, SystemMessage) for msg in chat_history)
-            if not has_system_prompt:
-                system_prompt = SystemMessage(content=system_prompt_content)
-                chat_history.insert(0, system_prompt)
+        self.llm_with_tools = self.llm.bind_tools(self.tools)
+        return self
+
+    async def _start_mcp(self, base_dir):
+        # 读取 mcp-mysql-server 的环境变量文件
+        mysql_server_dir = os.path.join(base_dir, "mcp-mysql-server")
+        mysql_env_path = os.path.join(mysql_server_dir, "env")
+        
+        mysql_env = os.environ.copy()
+        if os.path.exists(mysql_env_path):
+            logger.info(f"读取 MySQL 环境变量: {mysql_env_path}")
+            mysql_env.update(load_mysql_env(mysql_env_path))
+        
+        # 构建启动命令
+        script_path = os.path.join(mysql_server_dir, "node_modules", "@fhuang", "mcp-mysql-server", "build", "index.js")
+        logger.info(f"MCP Server 脚本路径: {script_path}")
         
-        llm_with_tools = llm.bind_tools(tools)
+        self.mcp_client = MultiServerMCPClient({
+            "mysql": {
+                "command": "node",
+                "args": [script_path],
+                "transport": "stdio",
+                "env": mysql_env
+            }
+        })
+            
+        logger.info("连接 MCP Server 并获取工具...")
+        # 常驻 MCP 会话：Node 进程和 MySQL 连接在进程生命周期内复用，不再每次工具调用都重新拉起
+        self.mcp_pool = await MCPSessionPool(self.mcp_client, "mysql").start()
+        return self.mcp_pool.tools
 
-        while True:
-            try:
-                user_input = input("\nUser: ")
-                logger.info(f"用户输入: {user_input}")
-                if user_input.lower() in ["exit", "quit"]:
-                    logger.info("用户退出会话")
-                    save_session(session_id, chat_history, key_info)
-                    logger.info(f"会话已保存: {session_id}")
-                    print(f"\n会话已保存: {session_id}")
-                    break
-            except EOFError:
-                logger.warning("收到 EOF，退出会话")
-                save_session(session_id, chat_history, key_info)
-                logger.info(f"会话已保存: {session_id}")
-                break
+    async def list_sessions(self):
+        return list_sessions()
+
+    async def open_session(self, session_id=None) -> ChatSession:
+        async with self._sessions_lock:
+            if session_id and session_id in self.sessions:
+                return self.sessions[session_id]
+            if session_id:
+                chat_history, key_info, state = load_session(session_id)
+                logger.info(f"加载会话: {session_id}, 消息数: {len(chat_history)}")
+            else:
+                session_id = str(uuid.uuid4())[:8]
+                chat_history, key_info, state = [], {}, {}
+                logger.info(f"创建新会话: {session_id}")
+
+            # 如果是新会话，添加 system prompt
+            if not chat_history:
+                chat_history = [SystemMessage(content=self.system_prompt_content)]
+            elif not any(isinstance(msg, SystemMessage) for msg in chat_history):
+                chat_history.insert(0, SystemMessage(content=self.system_prompt_content))
+                if state.get("slot_checkpoint"):
+                    state["slot_checkpoint"] += 1
+
+            session = ChatSession(session_id, chat_history, key_info, state)
+            self.sessions[session_id] = session
+            return session
+
+    async def close_session(self, session_id):
+        async with self._sessions_lock:
+            session = self.sessions.pop(session_id, None)
+        if session is not None:
+            if session.compaction_task is not None:
+                try:
+                    await asyncio.wait_for(session.compaction_task, 30)
+                except Exception:
+                    pass
+            async with session.lock:
+                session.save()
+            logger.info(f"会话已保存: {session_id}")
+
+    async def chat(self, session_id, user_input, on_token=None):
+        """处理一轮用户输入，返回最终回答。on_token 用于流式输出最终回答的 token。"""
+        session = await self.open_session(session_id)
+        async with session.lock:
+            return await self._run_turn(session, user_input, on_token)
+
+    async def _run_turn(self, session, user_input, on_token):
+        chat_history = session.chat_history
+        key_info = session.key_info
+        logger.info(f"[{session.session_id}] 用户输入: {user_input}")
+
+        # 构造当前对话的消息列表
+        # 将用户输入加入历史
+        chat_history.append(HumanMessage(content=user_input))
+        
+        # 使用滑动窗口构建当前消息列表（保留最近15轮 + key_info）
+        # 1. 增量更新槽位：只处理上次检查点之后的新消息
+        session.slot_tracker.update(chat_history)
 
-            # 构造当前对话的消息列表
-            # 将用户输入加入历史
-            chat_history.append(HumanMessage(content=user_input))
+        # 脚本化轮次（打招呼、回答场景/尺寸等）命中规则时直接按话术回复，不调用大模型
+        routed = self.router.route(user_input, chat_history, key_info)
+        if routed is not None:
+            logger.info(f"[{session.session_id}] Final Answer (快速通道): {routed}")
+            if STREAMING and on_token:
+                on_token(routed)
+            chat_history.append(AIMessage(content=routed))
+            session.slot_tracker.update(chat_history)
+            session.save()
+            return routed
+        
+        # 2. 静态 system prompt 在前作为可缓存前缀；槽位和早前对话摘要放在其后的第二条 system 消息
+        prompt_messages = [self.static_system_message]
+        dynamic_content = build_dynamic_context(key_info, session.summary)
+        if dynamic_content:
+            prompt_messages.append(SystemMessage(content=dynamic_content))
+        
+        # 3. 按 token 预算从最新往前取历史消息（不包含原始的 system prompt），AI/工具调用成组保留；
+        #    已并入滚动摘要的消息不再参与
+        messages_without_system = [msg for msg in chat_history if not isinstance(msg, SystemMessage)]
+        # 记下本轮开始时的摘要位置：dropped 是相对它计算的，后台摘要可能在本轮进行中推进它
+        summary_checkpoint = session.summary_checkpoint
+        unsummarized = messages_without_system[summary_checkpoint:]
+        context_messages, context_stats = build_context(unsummarized, CONTEXT_TOKEN_BUDGET)
+        
+        # 4. 组合：静态 system prompt + 动态上下文 + 历史消息
+        messages = prompt_messages + context_messages
+        messages = filter_orphan_tool_messages(messages)
+        
+        # 内部循环：处理多轮工具调用
+        turn_start = time.perf_counter()
+        turn_metrics = {
+            "llm_calls": 0, "ttft_ms": None, "generation_ms": 0.0, "prompt_tokens": [],
+            "cache_hit_tokens": 0, "cache_miss_tokens": 0,
+        }
+        while True:
+            turn_metrics["prompt_tokens"].append(sum(message_tokens(m) for m in messages))
+            if STREAMING:
+                response, call_metrics = await stream_llm_response(self.llm_with_tools, messages, on_token)
+            else:
+                call_start = time.perf_counter()
+                response = await self.llm_with_tools.ainvoke(messages)
+                call_metrics = {"first_token_at": None, "total_ms": (time.perf_counter() - call_start) * 1000, "streamed": False}
+            turn_metrics["llm_calls"] += 1
+            turn_metrics["generation_ms"] += call_metrics["total_ms"]
+            cache_usage = prompt_cache_usage(response)
+            if cache_usage is not None:
+                turn_metrics["cache_hit_tokens"] += cache_usage[0]
+                turn_metrics["cache_miss_tokens"] += cache_usage[1]
+            if call_metrics["first_token_at"] is not None:
+                # 首字时间：从用户输入到最终回答第一个 token 出现
+                turn_metrics["ttft_ms"] = (call_metrics["first_token_at"] - turn_start) * 1000
             
-            # 使用滑动窗口构建当前消息列表（保留最近15轮 + key_info）
-            # 1. 从当前对话历史中提取最新的 key_info
-            extracted_key_info = extract_key_info_from_messages(chat_history)
-            if extracted_key_info:
-                key_info.update(extracted_key_info)
+            # 将 AI 的回答加入历史（包括 tool_calls）
+            # 注意：如果是中间步骤，这个 response 包含 tool_calls；如果是最终步骤，它包含最终文本
+            messages.append(response)
             
-            # 2. 构建带槽位信息的动态 system prompt
-            dynamic_system_prompt_content = build_system_prompt_with_slots(
-                system_prompt_content, 
-                key_info
+            if response.tool_calls:
+                if response.content and VERBOSE:
+                    logger.debug(f"思考过程: {response.content}")
+                    print(f"\n> 思考过程:\n{response.content}\n")
+
+                # 执行工具：相互独立的调用并发执行，结果按 tool_call 原顺序写回
+                tool_outcomes = await run_tool_calls(response.tool_calls, self.tools, self.sql_cache, self.schema_cache)
+                for outcome in tool_outcomes:
+                    tool_msg = ToolMessage(content=outcome["result"], tool_call_id=outcome["id"])
+                    messages.append(tool_msg)
+                
+                # 继续内部循环，让 LLM 再次思考
+                continue
+
+            logger.info(f"[{session.session_id}] Final Answer: {response.content}")
+            turn_metrics["total_ms"] = (time.perf_counter() - turn_start) * 1000
+            ttft = turn_metrics["ttft_ms"]
+            logger.info(
+                f"本轮耗时: LLM 调用 {turn_metrics['llm_calls']} 次, "
+                f"首字 {f'{ttft:.0f}ms' if ttft is not None else '-'}, "
+                f"生成 {turn_metrics['generation_ms']:.0f}ms, 总计 {turn_metrics['total_ms']:.0f}ms"
+            )
+            prompt_tokens = turn_metrics["prompt_tokens"]
+            self._record_context(prompt_tokens, context_stats, turn_metrics)
+            logger.info(
+                f"本轮上下文: 历史保留 {context_stats['kept']} 条/丢弃 {context_stats['dropped']} 条 "
+                f"(≈{context_stats['tokens']} tokens), 各次调用 prompt ≈ {prompt_tokens} tokens"
+            )
+            hit, miss = turn_metrics["cache_hit_tokens"], turn_metrics["cache_miss_tokens"]
+            logger.info(
+                f"本轮前缀缓存: 命中 {hit} tokens, 未命中 {miss} tokens"
+                + (f" (命中率 {hit / (hit + miss):.0%})" if hit + miss else "")
             )
-            dynamic_system_prompt = SystemMessage(content=dynamic_system_prompt_content)
             
-            # 3. 获取滑动窗口消息（不包含原始的 system prompt）
-            messages_without_system = [msg for msg in chat_history if not isinstance(msg, SystemMessage)]
-            sliding_messages = get_sliding_window_messages(messages_without_system, window_size=25)
+            # 将最终回答加入历史
+            # 需要把 messages 中除了动态 system prompt 的部分都加入 chat_history
+            for msg in messages:
+                if not isinstance(msg, SystemMessage):
+                    if msg not in chat_history:
+                        chat_history.append(msg)
             
-            # 4. 组合：动态 system prompt + 滑动窗口消息
-            messages = [dynamic_system_prompt] + sliding_messages
-            messages = filter_orphan_tool_messages(messages)
+            # 确保最终的 AI 回答也在历史中
+            if response not in chat_history:
+                chat_history.append(response)
             
-            # 内部循环：处理多轮工具调用
-            while True:
-                # print("Agent 思考中...") # 减少啰嗦的输出
-                try:
-                    response = await llm_with_tools.ainvoke(messages)
-                    
-                    # 将 AI 的回答加入历史（包括 tool_calls）
-                    # 注意：如果是中间步骤，这个 response 包含 tool_calls；如果是最终步骤，它包含最终文本
-                    messages.append(response)
-                    
-                    if response.tool_calls:
-                        if response.content and VERBOSE:
-                            logger.debug(f"思考过程: {response.content}")
-                            print(f"\n> 思考过程:\n{response.content}\n")
-
-                        # 执行工具
-                        for tool_call in response.tool_calls:
-                            tool_name = tool_call["name"]
-                            tool_args = tool_call["args"]
-                            tool_id = tool_call["id"]
-                            
-                            if VERBOSE:
-                                logger.info(f"调用工具: {tool_name}, 参数: {tool_args}")
-                                print(f"🔧 调用工具: {tool_name}")
-                                print(f"   参数: {tool_args}")
-                            
-                            selected_tool = next((t for t in tools if t.name == tool_name), None)
-                            if selected_tool:
-                                try:
-                                    use_cache = False
-                                    cache_key = None
-                                    if tool_name == "query" and isinstance(tool_args, dict) and "sql" in tool_args:
-                                        cache_key = tool_args["sql"].strip()
-                                        cached = sql_cache.get(cache_key)
-                                        if cached is not None:
-                                            tool_result = cached
-                                            use_cache = True
-                                        else:
-                                            tool_result = await selected_tool.ainvoke(tool_args)
-                                            sql_cache.put(cache_key, tool_result)
-                                    elif tool_name == "describe_table" and isinstance(tool_args, dict) and "table" in tool_args:
-                                        cache_key = f"desc::{tool_args['table']}"
-                                        cached = schema_cache.get(cache_key)
-                                        if cached is not None:
-                                            tool_result = cached
-                                            use_cache = True
-                                        else:
-                                            tool_result = await selected_tool.ainvoke(tool_args)
-                                            schema_cache.put(cache_key, tool_result)
-                                    else:
-                                        tool_result = await selected_tool.ainvoke(tool_args)
-                                except Exception as e:
-                                    logger.error(f"工具执行错误: {e}")
-                                    tool_result = f"Error: {e}"
-                                
-                                result_str = str(tool_result)
-                                display_result = result_str[:200] + "..." if len(result_str) > 200 else result_str
-                                if VERBOSE:
-                                    logger.info(f"工具执行结果: {display_result}")
-                                    print(f"   结果: {display_result}{' (cached)' if 'use_cache' in locals() and use_cache else ''}\n")
-                                
-                                # 添加工具结果消息到 messages (用于下一轮思考)
-                                tool_msg = ToolMessage(content=result_str, tool_call_id=tool_id)
-                                messages.append(tool_msg)
-                        
-                        # 继续内部循环，让 LLM 再次思考
-                        continue
-                    
-                    else:
-                        logger.info(f"Final Answer: {response.content}")
-                        print("-" * 50)
-                        print(f"Final Answer:\n{response.content}")
-                        print("-" * 50)
-                        
-                        # 将最终回答加入历史
-                        # 需要把 messages 中除了动态 system prompt 的部分都加入 chat_history
-                        for msg in messages:
-                            if not isinstance(msg, SystemMessage):
-                                if msg not in chat_history:
-                                    chat_history.append(msg)
-                        
-                        # 确保最终的 AI 回答也在历史中
-                        if response not in chat_history:
-                            chat_history.append(response)
-                        
-                        # 从最新的对话中提取 key_info
-                        extracted_key_info = extract_key_info_from_messages(chat_history)
-                        if extracted_key_info:
-                            key_info.update(extracted_key_info)
-                        
-                        # 自动保存会话
-                        save_session(session_id, chat_history, key_info)
-                        logger.debug(f"会话已自动保存: {session_id}")
-                        break
-
-                except Exception as e:
-                    logger.error(f"对话处理出错: {e}")
-                    print(f"对话处理出错: {e}")
-                    break
+            # 从本轮新增的消息中更新槽位
+            changed = session.slot_tracker.update(chat_history)
+            if changed:
+                logger.info(f"[{session.session_id}] 槽位更新: {changed}")
+            
+            # 自动保存会话
+            session.save()
+            logger.debug(f"会话已自动保存: {session.session_id}")
+
+            # 本轮被挤出上下文的消息在后台并入滚动摘要，不占用回答时间
+            if SUMMARY_ENABLED and context_stats["dropped"] >= SUMMARY_MIN_MESSAGES:
+                self._schedule_compaction(session, summary_checkpoint, summary_checkpoint + context_stats["dropped"])
+            return response.content
+
+    def _schedule_compaction(self, session, start, until):
+        if session.compaction_task is not None and not session.compaction_task.done():
+            return
+        session.compaction_task = asyncio.create_task(self._compact(session, start, until))
+
+    async def _compact(self, session, start, until):
+        """把 [start, until) 的非 system 消息并入摘要；期间摘要位置被别的任务推进过则放弃，下轮重新计算。"""
+        if session.summary_checkpoint != start:
+            return
+        started_at = time.perf_counter()
+        previous_summary = session.summary
+        messages = [m for m in session.chat_history if not isinstance(m, SystemMessage)]
+        evicted = messages[start:until]
+        if not evicted:
+            return
+        try:
+            summary = await summarize(self.llm, previous_summary, evicted, SUMMARY_MAX_CHARS)
+        except Exception as e:
+            logger.warning(f"[{session.session_id}] 对话摘要失败，下轮重试: {e}")
+            return
+        if session.summary_checkpoint != start:
+            logger.info(f"[{session.session_id}] 摘要位置已变化，丢弃本次摘要")
+            return
+        session.summary = summary
+        session.summary_checkpoint = until
+        session.save()
+        logger.info(
+            f"[{session.session_id}] 对话摘要已更新: 并入 {len(evicted)} 条消息, "
+            f"摘要 {len(summary)} 字, 耗时 {(time.perf_counter() - started_at) * 1000:.0f}ms"
+        )
+
+    def _record_context(self, prompt_tokens, context_stats, turn_metrics):
+        stats = self._context_stats
+        stats["turns"] += 1
+        stats["prompt_tokens_total"] += sum(prompt_tokens)
+        stats["prompt_tokens_last"] = prompt_tokens[-1] if prompt_tokens else 0
+        stats["dropped_last"] = context_stats["dropped"]
+        stats["cache_hit_tokens_total"] += turn_metrics["cache_hit_tokens"]
+        stats["cache_miss_tokens_total"] += turn_metrics["cache_miss_tokens"]
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "sql_cache": self.sql_cache.stats(),
+            "schema_cache": len(self.schema_cache),
+            "qa_result_cache": qa_result_cache.stats(),
+            "fast_path": self.router.stats(),
+            "context": dict(self._context_stats),
+            "db_pool": get_pool().stats(),
+            "catalog": get_catalog().stats(),
+            "mcp": self.mcp_pool.stats() if self.mcp_pool else None,
+            "db_backend": self.db_backend.stats() if self.db_backend else None,
+        }
 
+    async def shutdown(self):
+        for session_id in list(self.sessions):
+            await self.close_session(session_id)
+        logger.info(f"知识库检索缓存统计: {qa_result_cache.stats()}")
+        logger.info(f"快速通道统计: {self.router.stats()}")
+        logger.info(f"SQL 结果缓存统计: {self.sql_cache.stats()}")
+        logger.info(f"数据库连接池统计: {get_pool().stats()}")
+        get_catalog().stop()
+        get_pool().close()
+        if self.mcp_pool is not None:
+            await self.mcp_pool.close()
+
+
+def choose_session(sessions):
+    if not sessions:
+        return None
+    print("\n可用的历史会话:")
+    for i, session in enumerate(sessions, 1):
+        print(f"{i}. {session['session_id']} (创建时间: {session['created_at']}, 消息数: {session['message_count']})")
+    print(f"{len(sessions) + 1}. 创建新会话")
+    
+    while True:
+        try:
+            choice = input("\n请选择会话编号 (回车默认创建新会话): ").strip()
+            if not choice:
+                return None
+            choice_num = int(choice)
+            if 1 <= choice_num <= len(sessions):
+                return sessions[choice_num - 1]["session_id"]
+            elif choice_num == len(sessions) + 1:
+                return None
+            else:
+                print("无效的选择，请重新输入")
+        except ValueError:
+            print("请输入有效的数字")
+
+
+async def main():
+    """
+    命令行 REPL：只负责输入输出，对话处理交给 AgentRuntime。
+    设置 AGENT_SERVER_URL 时连接已运行的 server.py，否则在本进程内启动运行时。
+    """
+    server_url = os.environ.get("AGENT_SERVER_URL")
+    try:
+        if server_url:
+            from server import RemoteAgentClient
+            client = RemoteAgentClient(server_url)
+            logger.info(f"连接智能体服务: {server_url}")
+        else:
+            client = await AgentRuntime().start()
     except Exception as e:
         logger.error(f"运行出错: {e}")
         print(f"运行出错: {e}")
+        return
+
+    # 会话选择
+    print("=" * 50)
+    print("欢迎使用智能对话系统")
+    print("=" * 50)
     
-    # 注意: langchain-mcp-adapters 目前版本不需要显式关闭 client
-    # 进程结束时会自动清理子进程
+    chosen_id = choose_session(await client.list_sessions())
+    session = await client.open_session(chosen_id)
+    session_id = session.session_id
+    print(f"\n{'已加载会话' if chosen_id else '创建新会话'}: {session_id}")
+    logger.info("开始运行智能体... (输入 'exit' 或 'quit' 退出)")
+
+    while True:
+        try:
+            user_input = input("\nUser: ")
+            if user_input.lower() in ["exit", "quit"]:
+                logger.info("用户退出会话")
+                await client.close_session(session_id)
+                print(f"\n会话已保存: {session_id}")
+                break
+        except EOFError:
+            logger.warning("收到 EOF，退出会话")
+            await client.close_session(session_id)
+            break
+
+        streamed = []
+
+        def on_token(token):
+            if not streamed:
+                print("-" * 50)
+                print("Final Answer:")
+            streamed.append(token)
+            print(token, end="", flush=True)
+
+        try:
+            answer = await client.chat(session_id, user_input, on_token)
+        except Exception as e:
+            logger.error(f"对话处理出错: {e}")
+            print(f"对话处理出错: {e}")
+            continue
+
+        if streamed:
+            # 流式模式下正文已经边生成边输出
+            print()
+        else:
+            print("-" * 50)
+            print(f"Final Answer:\n{answer}")
+        print("-" * 50)
+
+    if not server_url:
+        await client.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -2,10 +2,12 @@ import os
 import uuid
 import hashlib
 from typing import List, Tuple, Dict
-import chromadb
 from dotenv import load_dotenv
-from config import BASE_DIR, CHROMA_PATH
-from tools import AliyunEmbeddingFunction
+from config import BASE_DIR
+from embedding import AliyunEmbeddingFunction
+from media_index import MediaTagIndex, TAG_INDEX_NAME
+from retrieval import bump_collection_version
+from vector_store import VectorStore, open_store
 
 
 IMG_DIR = os.path.join(BASE_DIR, "img")
@@ -134,20 +136,18 @@ def _upsert_by_ids(collection, ids: List[str], documents: List[str], metadatas:
     collection.upsert(ids=ids, documents=documents, metadatas=metadatas)
 
 
-def _init_collection(client: chromadb.PersistentClient, name: str):
-    emb_fn = AliyunEmbeddingFunction()
-    return client.get_or_create_collection(name=name, embedding_function=emb_fn)
+def _init_collection(name: str, emb_fn: AliyunEmbeddingFunction) -> VectorStore:
+    return open_store(name, emb_fn)
 
 
 def build_multimodal_knowledge_base():
-    os.makedirs(CHROMA_PATH, exist_ok=True)
-    client = chromadb.PersistentClient(path=CHROMA_PATH)
-
-    img_collection = _init_collection(client, "kb_image")
-    vid_collection = _init_collection(client, "kb_video")
+    emb_fn = AliyunEmbeddingFunction()
+    img_collection = _init_collection("kb_image", emb_fn)
+    vid_collection = _init_collection("kb_video", emb_fn)
 
     img_paths = _list_media(IMG_DIR, (".jpg", ".jpeg", ".png", ".webp"))
     vid_paths = _list_media(VID_DIR, (".mp4", ".mov", ".mkv", ".avi"))
+    assets = []
 
     if img_paths:
         ids = []
@@ -159,7 +159,9 @@ def build_multimodal_knowledge_base():
             ids.append(_stable_id("img", p))
             docs.append(_build_doc(title, tags))
             metas.append({"path": p, "modality": "image", "title": title, "tags": tags})
+            assets.append(metas[-1])
         _upsert_by_ids(img_collection, ids, docs, metas)
+        bump_collection_version("kb_image")
 
     if vid_paths:
         ids = []
@@ -171,7 +173,13 @@ def build_multimodal_knowledge_base():
             ids.append(_stable_id("vid", p))
             docs.append(_build_doc(title, tags))
             metas.append({"path": p, "modality": "video", "title": title, "tags": tags})
+            assets.append(metas[-1])
         _upsert_by_ids(vid_collection, ids, docs, metas)
+        bump_collection_version("kb_video")
+
+    # 标签倒排索引：search_media_asset 优先按标签直接命中，无需向量检索
+    MediaTagIndex(assets).save()
+    bump_collection_version(TAG_INDEX_NAME)
 
 
 if __name__ == "__main__":
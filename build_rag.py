@@ -1,56 +1,85 @@
 import os
+import re
+import json
+import hashlib
 import shutil
 from typing import List, Dict
-import chromadb
-from chromadb.utils import embedding_functions
-import dashscope
-from dashscope import TextEmbedding
-from http import HTTPStatus
 from dotenv import load_dotenv
 from config import (
     BASE_DIR,
     CHROMA_PATH,
     QA_TXT_DIR,
     EMBEDDING_MODEL_NAME,
-    EMBEDDING_DIMENSION,
-    DASHSCOPE_API_KEY
+    VECTOR_BACKEND
 )
+from embedding import AliyunEmbeddingFunction
+from lexical_index import LexicalIndex, index_path
+from retrieval import bump_collection_version
+from vector_store import open_store
 
 load_dotenv()
 
+COLLECTION_NAME = "qa_knowledge_base"
+MANIFEST_PATH = os.path.join(CHROMA_PATH, f"{COLLECTION_NAME}.{VECTOR_BACKEND}.manifest.json")
 
-class AliyunEmbeddingFunction(embedding_functions.EmbeddingFunction):
-    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, 
-                 dimension: int = EMBEDDING_DIMENSION,
-                 api_key: str = DASHSCOPE_API_KEY):
-        self.model_name = model_name
-        self.dimension = dimension
-        self.api_key = api_key
-        if self.api_key:
-            dashscope.api_key = self.api_key
-        else:
-            raise ValueError("DASHSCOPE_API_KEY is required. Please set it in .env file.")
-    
-    def __call__(self, input: List[str]) -> List[List[float]]:
-        all_embeddings = []
-        
-        for text in input:
-            resp = TextEmbedding.call(
-                model=self.model_name,
-                input=text,
-                dimension=self.dimension
-            )
-            
-            if resp.status_code == HTTPStatus.OK:
-                embedding = resp.output['embeddings'][0]['embedding']
-                all_embeddings.append(embedding)
-            else:
-                raise RuntimeError(f"Embedding request failed: {resp}")
-        
-        return all_embeddings
+
+def chunk_id(source: str, text: str) -> str:
+    digest = hashlib.sha1(f"{source}\n{text}".encode("utf-8")).hexdigest()[:16]
+    return f"{source}:{digest}"
+
+
+QUESTION_RE = re.compile(r"^Q\s*[：:]\s*(.*)$")
+ANSWER_RE = re.compile(r"^A\s*[：:]\s*(.*)$")
+# "发票可以多开吗 / 发票金额可以写多一点吗"、"可以设置语言的吗/能支持多种语言吗" 视为同义问法；
+# "DDR3/DDR4"、"双系统/单安卓客户" 这类斜杠不拆分
+PARAPHRASE_SPLIT_RE = re.compile(r"\s+/\s+|(?<=[吗？?])\s*/\s*")
+
+
+def split_paraphrases(question: str) -> List[str]:
+    return [q.strip() for q in PARAPHRASE_SPLIT_RE.split(question) if q.strip()]
+
+
+def parse_qa_text(content: str) -> List[Dict]:
+    """
+    解析 "Q：...\nA：..." 结构的话术文本，返回 [{"question", "keys", "answer"}]。
+    答案可以跨多行；没有 Q/A 标记的文本按空行分段，整段作为答案。
+    """
+    items = []
+    current = None
+    for raw_line in content.splitlines():
+        line = raw_line.strip()
+        q_match = QUESTION_RE.match(line)
+        a_match = ANSWER_RE.match(line)
+        if q_match:
+            current = {"question": q_match.group(1).strip(), "answer_lines": []}
+            items.append(current)
+        elif a_match and current is not None:
+            current["answer_lines"].append(a_match.group(1).strip())
+        elif line and current is not None and current["answer_lines"]:
+            current["answer_lines"].append(line)
+        elif line and current is not None:
+            current["question"] = f"{current['question']} {line}".strip()
+
+    if not items:
+        items = [{"question": "", "answer_lines": [chunk.strip()]}
+                 for chunk in content.split("\n\n") if chunk.strip()]
+
+    parsed = []
+    for item in items:
+        answer = "\n".join(item["answer_lines"]).strip()
+        if not answer:
+            continue
+        question = item["question"]
+        keys = split_paraphrases(question) or [answer]
+        parsed.append({"question": question, "keys": keys, "answer": answer})
+    return parsed
 
 
 def load_documents(directory: str) -> List[Dict]:
+    """
+    每条问答按问题（及同义问法）生成检索键：键文本用于向量化和词法检索，
+    答案作为负载存入 metadata，检索时只把答案返回给模型。
+    """
     documents = []
     if not os.path.exists(directory):
         print(f"Warning: Directory {directory} does not exist.")
@@ -61,29 +90,58 @@ def load_documents(directory: str) -> List[Dict]:
             filepath = os.path.join(directory, filename)
             with open(filepath, "r", encoding="utf-8") as f:
                 content = f.read()
-                chunks = content.split("\n\n")
-                for i, chunk in enumerate(chunks):
-                    chunk = chunk.strip()
-                    if chunk:
-                        documents.append({
-                            "id": f"{filename}_{i}",
-                            "text": chunk,
-                            "source": filename
-                        })
+            for item in parse_qa_text(content):
+                qa_id = chunk_id(filename, f"{item['question']}\n{item['answer']}")
+                for key in item["keys"]:
+                    documents.append({
+                        "id": chunk_id(filename, f"{key}\n{item['answer']}"),
+                        "text": key,
+                        "source": filename,
+                        "qa_id": qa_id,
+                        "question": item["question"],
+                        "answer": item["answer"]
+                    })
     return documents
 
 
-def init_chromadb():
-    if not os.path.exists(CHROMA_PATH):
-        os.makedirs(CHROMA_PATH)
-    client = chromadb.PersistentClient(path=CHROMA_PATH)
+def doc_metadata(doc: Dict) -> Dict:
+    return {
+        "source": doc["source"],
+        "qa_id": doc["qa_id"],
+        "question": doc["question"],
+        "answer": doc["answer"]
+    }
+
+
+def metadata_digest(doc: Dict) -> str:
+    """键文本不变但元数据（如新增同义问法后的 qa_id / question）变化时，靠它判断需要重新写入。"""
+    payload = json.dumps(doc_metadata(doc), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def init_store():
     print(f"Loading embedding model: {EMBEDDING_MODEL_NAME}...")
     embedding_fn = AliyunEmbeddingFunction()
-    collection = client.get_or_create_collection(
-        name="qa_knowledge_base",
-        embedding_function=embedding_fn
-    )
-    return collection
+    print(f"Vector backend: {VECTOR_BACKEND}")
+    return open_store(COLLECTION_NAME, embedding_fn)
+
+
+def load_manifest() -> Dict[str, Dict]:
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f).get("chunks", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(chunks: Dict[str, Dict]) -> None:
+    os.makedirs(CHROMA_PATH, exist_ok=True)
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"collection": COLLECTION_NAME, "chunks": chunks}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, MANIFEST_PATH)
 
 
 def build_knowledge_base():
@@ -96,22 +154,53 @@ def build_knowledge_base():
         print("No documents found. Exiting.")
         return
 
-    collection = init_chromadb()
-    
-    if collection.count() == 0:
-        print("Adding documents to ChromaDB...")
-        ids = [doc["id"] for doc in docs]
-        documents = [doc["text"] for doc in docs]
-        metadatas = [{"source": doc["source"]} for doc in docs]
-        
-        collection.add(
-            ids=ids,
-            documents=documents,
-            metadatas=metadatas
+    collection = init_store()
+
+    # 以内容哈希为 ID：未改动的段落 ID 不变，只需增删有变化的部分
+    wanted = {}
+    for doc in docs:
+        wanted.setdefault(doc["id"], doc)
+
+    # 以向量库中实际存在的 ID 为准（向量库目录被删掉时清单仍在，不能只信清单）；
+    # 清单只用来比对元数据摘要
+    stored = set(collection.ids())
+    manifest = load_manifest()
+
+    to_add = [
+        doc for doc_id, doc in wanted.items()
+        if doc_id not in stored or manifest.get(doc_id, {}).get("meta") != metadata_digest(doc)
+    ]
+    to_delete = [doc_id for doc_id in stored if doc_id not in wanted]
+
+    if to_delete:
+        collection.delete(ids=to_delete)
+        print(f"Deleted {len(to_delete)} stale chunks.")
+
+    if to_add:
+        collection.upsert(
+            ids=[doc["id"] for doc in to_add],
+            documents=[doc["text"] for doc in to_add],
+            metadatas=[doc_metadata(doc) for doc in to_add]
         )
-        print(f"Successfully added {len(docs)} documents.")
+        print(f"Upserted {len(to_add)} new or changed question keys.")
+
+    save_manifest({doc_id: {"source": doc["source"], "meta": metadata_digest(doc)} for doc_id, doc in wanted.items()})
+
+    lexical_path = index_path(COLLECTION_NAME)
+    lexical_missing = not os.path.exists(lexical_path)
+    if to_add or to_delete or lexical_missing:
+        LexicalIndex.build(
+            ids=list(wanted.keys()),
+            documents=[doc["text"] for doc in wanted.values()],
+            metadatas=[doc_metadata(doc) for doc in wanted.values()]
+        ).save(lexical_path)
+        print(f"Lexical index written: {lexical_path}")
+
+    if to_add or to_delete or lexical_missing:
+        bump_collection_version(COLLECTION_NAME)
+        print(f"Knowledge base updated, {collection.count()} chunks indexed.")
     else:
-        print(f"Collection already contains {collection.count()} documents. Skipping insertion.")
+        print(f"Knowledge base is up to date ({collection.count()} chunks).")
 
 
 if __name__ == "__main__":
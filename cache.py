@@ -1,5 +1,11 @@
+import json
+import math
+import re
+import threading
+import time
+import unicodedata
 from collections import OrderedDict
-from typing import Any, Optional
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
 
 
 class LRUCache:
@@ -26,3 +32,234 @@ class LRUCache:
 
     def __len__(self) -> int:
         return len(self.cache)
+
+
+def normalize_query(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return "".join(ch for ch in text if not (ch.isspace() or unicodedata.category(ch).startswith("P")))
+
+
+def _norm(vec: Sequence[float]) -> float:
+    return math.sqrt(sum(x * x for x in vec))
+
+
+class SemanticResultCache:
+    """
+    检索结果缓存：先按规范化后的查询字符串精确命中，
+    再按查询向量的余弦距离匹配近似问法。集合版本变化时整体失效。
+    """
+
+    def __init__(self, capacity: int = 256, max_distance: float = 0.08):
+        self.capacity = capacity
+        self.max_distance = max_distance
+        self.entries = OrderedDict()
+        self.version = None
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def sync_version(self, version: Any) -> None:
+        with self._lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+
+    def get_exact(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry[2]
+
+    def get_similar(self, embedding: Sequence[float]) -> Optional[Any]:
+        q_norm = _norm(embedding)
+        with self._lock:
+            best_key, best_dist = None, None
+            if q_norm > 0:
+                for key, (vec, vec_norm, _) in self.entries.items():
+                    if vec_norm == 0:
+                        continue
+                    dist = 1.0 - sum(a * b for a, b in zip(embedding, vec)) / (q_norm * vec_norm)
+                    if best_dist is None or dist < best_dist:
+                        best_key, best_dist = key, dist
+            if best_key is not None and best_dist <= self.max_distance:
+                self.entries.move_to_end(best_key)
+                self.semantic_hits += 1
+                return self.entries[best_key][2]
+            self.misses += 1
+            return None
+
+    def put(self, key: str, embedding: Optional[Sequence[float]], value: Any) -> None:
+        """embedding 为 None 时只能被精确命中（例如词法检索直接返回的结果）。"""
+        embedding = embedding or []
+        with self._lock:
+            if key in self.entries:
+                self.entries.pop(key)
+            elif len(self.entries) >= self.capacity:
+                self.entries.popitem(last=False)
+            self.entries[key] = (list(embedding), _norm(embedding), value)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self.entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+            }
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+_SQL_LITERAL_RE = re.compile(r"('(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\")")
+_SQL_TABLE_RE = re.compile(r"\b(?:from|join|update|into|table)\s+((?:`[^`]+`|[^\s,;()]+)(?:\s*,\s*(?:`[^`]+`|[^\s,;()]+))*)", re.IGNORECASE)
+_SQL_WRITE_RE = re.compile(r"^\s*(insert|update|delete|replace|alter|truncate|drop|create|rename)\b", re.IGNORECASE)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    SQL 规范化：字符串字面量原样保留，其余部分合并空白、去掉运算符两侧空白、转小写、去掉结尾分号，
+    使只有空白或大小写差异的同一条查询命中同一缓存项。
+    """
+    parts = _SQL_LITERAL_RE.split((sql or "").strip().rstrip(";").strip())
+    out = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            out.append(part)
+        else:
+            part = re.sub(r"\s+", " ", part).lower()
+            out.append(re.sub(r"\s*([=<>!,()])\s*", r"\1", part))
+    return "".join(out)
+
+
+def sql_tables(sql: str) -> Set[str]:
+    """粗略解析 SQL 依赖的表名（FROM/JOIN/UPDATE/INTO 之后的标识符）。"""
+    stripped = _SQL_LITERAL_RE.sub("''", sql or "")
+    tables = set()
+    for match in _SQL_TABLE_RE.finditer(stripped):
+        for name in match.group(1).split(","):
+            name = name.strip().strip("`").split(".")[-1].strip("`")
+            if name and name.lower() not in ("select", "dual"):
+                tables.add(name.lower())
+    return tables
+
+
+def is_write_sql(sql: str) -> bool:
+    return bool(_SQL_WRITE_RE.match(sql or ""))
+
+
+class SQLResultCache:
+    """
+    进程内共享的 SQL 结果缓存：键为规范化后的 SQL（加上参数），每条记录登记依赖的表，
+    过期时间取依赖表 TTL 的最小值。写语句不缓存，并使相关表的缓存失效；
+    表数据在别处被修改时调用 invalidate_table，注册的监听器（如商品目录）会一起收到通知。
+    """
+
+    def __init__(self, capacity: int = 256, default_ttl: float = 300, table_ttl: Optional[Dict[str, float]] = None):
+        self.capacity = capacity
+        self.default_ttl = default_ttl
+        self.table_ttl = {k.lower(): v for k, v in (table_ttl or {}).items()}
+        self.entries = OrderedDict()
+        self.by_table: Dict[str, Set[str]] = {}
+        self._listeners: List[Callable[[str], None]] = []
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def ttl_for(self, tables: Set[str]) -> float:
+        return min((self.table_ttl.get(t, self.default_ttl) for t in tables), default=self.default_ttl)
+
+    @staticmethod
+    def key(sql: str, params: Optional[Sequence] = None) -> str:
+        """缓存键：规范化 SQL，带参数时附上参数，同一条参数化 SQL 的不同参数各自缓存。"""
+        key = normalize_sql(sql)
+        if params:
+            key += "\x00" + json.dumps(list(params), ensure_ascii=False, default=str)
+        return key
+
+    def get(self, sql: str, params: Optional[Sequence] = None) -> Optional[Any]:
+        if is_write_sql(sql):
+            return None
+        key = self.key(sql, params)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            expires_at, _, value = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def put(self, sql: str, value: Any, params: Optional[Sequence] = None) -> None:
+        if is_write_sql(sql):
+            self.invalidate_sql(sql)
+            return
+        tables = sql_tables(sql)
+        key = self.key(sql, params)
+        with self._lock:
+            if key in self.entries:
+                self._remove(key)
+            elif len(self.entries) >= self.capacity:
+                self._remove(next(iter(self.entries)))
+                self._stats["evictions"] += 1
+            self.entries[key] = (time.monotonic() + self.ttl_for(tables), tables, value)
+            for table in tables:
+                self.by_table.setdefault(table, set()).add(key)
+
+    def _remove(self, key: str) -> None:
+        _, tables, _ = self.entries.pop(key)
+        for table in tables:
+            keys = self.by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.by_table[table]
+
+    def invalidate_table(self, table: str) -> int:
+        """清掉依赖该表的所有缓存项并用规范化后的表名通知监听器，返回清掉的条数。"""
+        table_key = table.strip("`").lower()
+        with self._lock:
+            keys = list(self.by_table.get(table_key, ()))
+            for key in keys:
+                self._remove(key)
+            self._stats["invalidations"] += len(keys)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(table_key)
+            except Exception:
+                pass
+        return len(keys)
+
+    def invalidate_sql(self, sql: str) -> int:
+        """写语句执行成功后调用：使它涉及的所有表失效，返回清掉的条数。"""
+        return sum(self.invalidate_table(table) for table in sql_tables(sql))
+
+    def add_invalidation_listener(self, listener: Callable[[str], None]) -> None:
+        with self._lock:
+            self._listeners.append(listener)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.entries.clear()
+            self.by_table.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self.entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,195 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from config import CATALOG_ENABLED, CATALOG_REFRESH_INTERVAL
+from db import get_pool, sql_result_cache
+from logger import logger
+
+
+CATALOG_TABLES = ["商品报价表", "尺寸表", "内存硬盘升级报价表", "处理器升级报价表", "防眩光升级报价表", "赠品表"]
+
+
+def _key(value: Any) -> str:
+    # 与 MySQL 默认 *_ci 排序规则一致：忽略大小写和尾部空格
+    return str(value).strip().lower() if value is not None else ""
+
+
+class CatalogSnapshot:
+    """某一时刻六张商品表的只读快照，按查询条件预先建好索引。"""
+
+    def __init__(self, tables: Dict[str, List[Dict[str, Any]]], version: Optional[Tuple] = None):
+        self.tables = tables
+        self.version = version
+        self.loaded_at = time.time()
+
+        self.price_by_size_config: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.products_by_size: Dict[str, List[Dict[str, Any]]] = {}
+        for row in tables.get("商品报价表", []):
+            size, config = _key(row.get("尺寸")), _key(row.get("配置"))
+            self.price_by_size_config.setdefault((size, config), row)
+            self.products_by_size.setdefault(size, []).append(row)
+
+        self.size_info = {}
+        for row in tables.get("尺寸表", []):
+            self.size_info.setdefault(_key(row.get("尺寸")), row)
+
+        self.memory_upgrades = self._group("内存硬盘升级报价表", "配置")
+        self.processor_upgrades = self._group("处理器升级报价表", "机型")
+        self.anti_glare_upgrades = self._group("防眩光升级报价表", "尺寸")
+        gifts = sorted(tables.get("赠品表", []), key=lambda r: (r.get("序列") is None, r.get("序列")))
+        self.gifts = [row["赠品"] for row in gifts]
+
+    def _group(self, table: str, column: str) -> Dict[str, List[Dict[str, Any]]]:
+        index: Dict[str, List[Dict[str, Any]]] = {}
+        for row in self.tables.get(table, []):
+            index.setdefault(_key(row.get(column)), []).append(row)
+        return index
+
+    def product_price(self, 尺寸: str, 配置: str) -> Optional[Dict[str, Any]]:
+        row = self.price_by_size_config.get((_key(尺寸), _key(配置)))
+        return dict(row) if row else None
+
+    def products(self, 尺寸: str) -> List[Dict[str, Any]]:
+        return [dict(r) for r in self.products_by_size.get(_key(尺寸), [])]
+
+    def configs(self, 尺寸: str) -> List[str]:
+        return list(dict.fromkeys(r["配置"] for r in self.products_by_size.get(_key(尺寸), [])))
+
+    def i5_i7_price_rows(self, 尺寸: str) -> List[Dict[str, Any]]:
+        return [
+            {k: r.get(k) for k in ("配置", "尺寸", "价格", "底价")}
+            for r in self.products_by_size.get(_key(尺寸), [])
+            if "i5" in _key(r.get("配置")) or "i7" in _key(r.get("配置"))
+        ]
+
+    def size(self, 尺寸: str) -> Optional[Dict[str, Any]]:
+        row = self.size_info.get(_key(尺寸))
+        return dict(row) if row else None
+
+    def sizes(self) -> List[Dict[str, Any]]:
+        return [dict(r) for r in self.tables.get("尺寸表", [])]
+
+    def memory_upgrade(self, 配置: str) -> List[Dict[str, Any]]:
+        return [dict(r) for r in self.memory_upgrades.get(_key(配置), [])]
+
+    def processor_upgrade(self, 机型: str) -> List[Dict[str, Any]]:
+        return [dict(r) for r in self.processor_upgrades.get(_key(机型), [])]
+
+    def anti_glare_upgrade(self, 尺寸: str) -> List[Dict[str, Any]]:
+        return [dict(r) for r in self.anti_glare_upgrades.get(_key(尺寸), [])]
+
+
+class ProductCatalog:
+    """
+    商品目录：启动时把六张小表整体读入内存，db_queries 的查询函数直接从快照返回结果。
+    后台线程每隔 CATALOG_REFRESH_INTERVAL 秒用 CHECKSUM TABLE 检查表是否变化，变化时重新加载并整体替换快照；
+    数据库不支持 CHECKSUM 时按间隔无条件重载。
+    """
+
+    def __init__(self, refresh_interval: float = CATALOG_REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"loads": 0, "checks": 0, "load_ms_last": 0.0, "errors": 0}
+
+    @property
+    def snapshot(self) -> Optional[CatalogSnapshot]:
+        return self._snapshot
+
+    def version(self) -> Optional[Tuple]:
+        try:
+            tables = ", ".join(f"`{t}`" for t in CATALOG_TABLES)
+            rows = get_pool().fetch_all(f"CHECKSUM TABLE {tables}")
+            return tuple(r.get("Checksum") for r in rows)
+        except Exception as e:
+            logger.debug(f"商品目录版本检查失败，将直接重新加载: {e}")
+            return None
+
+    def load(self, version: Optional[Tuple] = None) -> CatalogSnapshot:
+        start = time.perf_counter()
+        pool = get_pool()
+        tables = {table: pool.fetch_all(f"SELECT * FROM `{table}`") for table in CATALOG_TABLES}
+        snapshot = CatalogSnapshot(tables, version)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._snapshot = snapshot
+            self._stats["loads"] += 1
+            self._stats["load_ms_last"] = elapsed_ms
+        logger.info(
+            f"商品目录已加载 ({elapsed_ms:.0f}ms): "
+            + ", ".join(f"{t} {len(rows)} 行" for t, rows in tables.items())
+        )
+        return snapshot
+
+    def refresh(self, force: bool = False) -> bool:
+        """表有变化（或 force）时重新加载，返回是否重新加载。"""
+        with self._lock:
+            self._stats["checks"] += 1
+        try:
+            version = self.version()
+            current = self._snapshot
+            if not force and current is not None and version is not None and version == current.version:
+                return False
+            self.load(version)
+            return True
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+            logger.warning(f"商品目录刷新失败，继续使用旧快照: {e}")
+            return False
+
+    def invalidate(self) -> None:
+        """表数据被修改后调用，立即重新加载。"""
+        self.refresh(force=True)
+
+    def _on_table_invalidated(self, table: str) -> None:
+        # SQL 缓存的失效通知可能来自事件循环线程，重新加载放到后台线程
+        if table.strip("`") in CATALOG_TABLES and self._snapshot is not None:
+            threading.Thread(target=self.invalidate, name="catalog-invalidate", daemon=True).start()
+
+    def start(self) -> "ProductCatalog":
+        self.refresh(force=True)
+        sql_result_cache.add_invalidation_listener(self._on_table_invalidated)
+        if self.refresh_interval and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="catalog-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_interval):
+            self.refresh()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        snapshot = self._snapshot
+        stats["loaded"] = snapshot is not None
+        if snapshot is not None:
+            stats["age_s"] = round(time.time() - snapshot.loaded_at, 1)
+            stats["rows"] = {t: len(rows) for t, rows in snapshot.tables.items()}
+        return stats
+
+
+_catalog: Optional[ProductCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> ProductCatalog:
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = ProductCatalog()
+    return _catalog
+
+
+def catalog_snapshot() -> Optional[CatalogSnapshot]:
+    """已加载且启用时返回当前快照，否则返回 None（调用方回退到直接查库）。"""
+    if not CATALOG_ENABLED or _catalog is None:
+        return None
+    return _catalog.snapshot
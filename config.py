@@ -15,21 +15,86 @@ IMG_DIR = os.path.join(BASE_DIR, "img")
 VID_DIR = os.path.join(BASE_DIR, "video")
 LOG_DIR = os.path.join(BASE_DIR, "logs")
 SESSION_DIR = os.path.join(BASE_DIR, "sessions")
+EMBEDDING_CACHE_DIR = os.path.join(BASE_DIR, "embedding_cache")
+VECTOR_STORE_DIR = os.path.join(BASE_DIR, "vector_store")
+MYSQL_ENV_PATH = os.path.join(BASE_DIR, "mcp-mysql-server", "env")
+SCHEMA_DOC_PATH = os.path.join(BASE_DIR, "skills", "database_query", "references", "database_schema.md")
 
 EMBEDDING_MODEL_NAME = "text-embedding-v4"
 EMBEDDING_DIMENSION = 1024
+# text-embedding-v4 单次请求最多 10 条文本
+EMBEDDING_BATCH_SIZE = 10
+EMBEDDING_MAX_CONCURRENCY = 4
+EMBEDDING_MAX_RETRIES = 5
+EMBEDDING_RETRY_BASE_DELAY = 0.5
+# 向量存储后端: "chroma" (chromadb 持久化) 或 "mmap" (进程内内存映射矩阵)
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma").lower()
+
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_MAX_BYTES = 64 * 1024 * 1024
 
 DEEPSEEK_API_KEY: Optional[str] = os.environ.get("DEEPSEEK_API_KEY")
 DASHSCOPE_API_KEY: Optional[str] = os.environ.get("DASHSCOPE_API_KEY")
 AGENT_VERBOSE: bool = str(os.environ.get("AGENT_VERBOSE", "")).lower() in ("1", "true", "yes")
+AGENT_STREAMING: bool = str(os.environ.get("AGENT_STREAMING", "1")).lower() in ("1", "true", "yes")
+# 流式输出时开头先攒这么多字再发出：工具调用步骤的中间说明通常很短，攒够仍未出现 tool_call 即按最终回答输出
+STREAM_HOLDBACK_CHARS = 30
+# 规则快速通道：打招呼、回答场景/尺寸等脚本化轮次直接按话术回复，不调用大模型
+AGENT_FAST_PATH: bool = str(os.environ.get("AGENT_FAST_PATH", "1")).lower() in ("1", "true", "yes")
 
 DEEPSEEK_BASE_URL = "https://api.deepseek.com"
 DEEPSEEK_MODEL = "deepseek-chat"
 DEEPSEEK_TEMPERATURE = 0.0
 
-SLIDING_WINDOW_SIZE = 15
+# 多会话 HTTP 服务 (server.py)
+SERVER_HOST = os.environ.get("AGENT_SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.environ.get("AGENT_SERVER_PORT", "8765"))
+
+# 常驻 MCP 会话池：会话数、健康检查间隔（秒，0 关闭）、单个会话启动超时（秒）
+MCP_POOL_SIZE = int(os.environ.get("AGENT_MCP_POOL_SIZE", "1"))
+MCP_HEALTH_CHECK_INTERVAL = 60
+MCP_START_TIMEOUT = 30
+
+# 单个工具调用的超时（秒），同一步的多个工具调用并发执行
+TOOL_CALL_TIMEOUT = 30
+
+# 数据库工具后端: "mcp" (Node mcp-mysql-server), "mysql" (进程内连接池) 或 "sqlite" (本地替身，见 db_backend.py)
+DB_BACKEND = os.environ.get("AGENT_DB_BACKEND", "mcp").lower()
+# skill 查询函数直连 MySQL 的连接池
+DB_POOL_SIZE = 4
+DB_CONNECT_TIMEOUT = 5
+# 商品目录快照（catalog.py）：六张商品表常驻内存，按间隔检查表是否变化
+CATALOG_ENABLED: bool = str(os.environ.get("AGENT_CATALOG", "1")).lower() in ("1", "true", "yes")
+CATALOG_REFRESH_INTERVAL = 300
+
+# 历史消息的 token 预算（不含 system prompt），按本地估算从最新往前填充
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("AGENT_CONTEXT_BUDGET", "6000"))
+# 滚动摘要：被挤出上下文的消息累计到 SUMMARY_MIN_MESSAGES 条后在后台并入摘要
+SUMMARY_ENABLED: bool = str(os.environ.get("AGENT_SUMMARY", "1")).lower() in ("1", "true", "yes")
+SUMMARY_MAX_CHARS = 600
+SUMMARY_MIN_MESSAGES = 4
+# 会话日志追加这么多条记录后整份压缩重写一次（去掉过期的状态记录）
+SESSION_COMPACT_EVERY = 200
 SQL_CACHE_CAPACITY = 256
+# SQL 结果缓存的默认 TTL（秒）及按表覆盖；一条查询依赖多张表时取最小值
+SQL_CACHE_DEFAULT_TTL = 300
+SQL_CACHE_TABLE_TTL = {
+    "商品报价表": 600,
+    "尺寸表": 3600,
+    "赠品表": 3600,
+    "产品功能介绍话术_qa": 3600,
+    "常见问题话术_qa": 3600,
+    "开场了解需求话术_qa": 3600,
+}
 SCHEMA_CACHE_CAPACITY = 64
+RESULT_CACHE_CAPACITY = 256
+RESULT_CACHE_MAX_DISTANCE = 0.08
+# 混合检索：词法/向量各取的候选数；词法结果可直接采用时第一名相对第二名的最小分数比、
+# 查询至少包含的关键词（二元组）数，以及第一名文档的关键词出现在查询中的最低比例
+HYBRID_CANDIDATES = 8
+LEXICAL_CONFIDENT_MARGIN = 1.5
+LEXICAL_MIN_QUERY_TERMS = 3
+LEXICAL_MIN_DOC_COVERAGE = 0.8
 
 LOG_MAX_BYTES = 10 * 1024 * 1024
 LOG_BACKUP_COUNT = 5
@@ -61,6 +126,10 @@ def get_config_summary() -> str:
     summary.append(f"Video Directory: {VID_DIR}")
     summary.append(f"Embedding Model: {EMBEDDING_MODEL_NAME}")
     summary.append(f"Embedding Dimension: {EMBEDDING_DIMENSION}")
+    summary.append(f"Vector Backend: {VECTOR_BACKEND}")
     summary.append(f"DeepSeek Model: {DEEPSEEK_MODEL}")
     summary.append(f"Verbose Mode: {'ON' if AGENT_VERBOSE else 'OFF'}")
+    summary.append(f"Streaming: {'ON' if AGENT_STREAMING else 'OFF'}")
+    summary.append(f"Fast Path: {'ON' if AGENT_FAST_PATH else 'OFF'}")
+    summary.append(f"DB Backend: {DB_BACKEND}")
     return "\n".join(summary)
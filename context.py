@@ -0,0 +1,95 @@
+import json
+from typing import Dict, List, Optional, Tuple
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+
+# DeepSeek 官方换算：1 个中文字符约 0.6 token，1 个英文字符约 0.3 token
+CJK_TOKENS_PER_CHAR = 0.6
+OTHER_TOKENS_PER_CHAR = 0.3
+# 每条消息的角色/分隔符开销
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _is_cjk(ch: str) -> bool:
+    code = ord(ch)
+    return (
+        0x4E00 <= code <= 0x9FFF
+        or 0x3400 <= code <= 0x4DBF
+        or 0x3000 <= code <= 0x303F
+        or 0xFF00 <= code <= 0xFFEF
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """本地估算 token 数，不调用分词器服务。"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if _is_cjk(ch))
+    return int(cjk * CJK_TOKENS_PER_CHAR + (len(text) - cjk) * OTHER_TOKENS_PER_CHAR) + 1
+
+
+def message_tokens(message: BaseMessage) -> int:
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content, ensure_ascii=False)
+    tokens = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        tokens += estimate_tokens(json.dumps(tool_calls, ensure_ascii=False, default=str))
+    return tokens
+
+
+def group_turn_units(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    """把带 tool_calls 的 AI 消息和紧随其后的 ToolMessage 合成一个单元，保证截断时不拆散。"""
+    units: List[List[BaseMessage]] = []
+    for msg in messages:
+        if isinstance(msg, ToolMessage) and units and _accepts_tool_result(units[-1], msg):
+            units[-1].append(msg)
+        else:
+            units.append([msg])
+    return units
+
+
+def _accepts_tool_result(unit: List[BaseMessage], msg: ToolMessage) -> bool:
+    head = unit[0]
+    if not isinstance(head, AIMessage) or not head.tool_calls:
+        return False
+    ids = {tc.get("id") for tc in head.tool_calls if isinstance(tc, dict)}
+    return msg.tool_call_id in ids
+
+
+def build_context(messages: List[BaseMessage], budget: int) -> Tuple[List[BaseMessage], Dict[str, int]]:
+    """
+    按 token 预算从最新往前填充上下文，以单元为粒度整体保留或丢弃；
+    最新一个单元（当前用户输入）无论多大都保留。
+    返回 (上下文消息, 统计)，统计含 tokens / kept / dropped。
+    """
+    units = group_turn_units(messages)
+    selected: List[List[BaseMessage]] = []
+    total = 0
+    for unit in reversed(units):
+        unit_tokens = sum(message_tokens(m) for m in unit)
+        if selected and total + unit_tokens > budget:
+            break
+        selected.append(unit)
+        total += unit_tokens
+    selected.reverse()
+    # 截断点尽量落在用户消息上，避免上下文以半轮对话开头
+    while len(selected) > 1 and len(selected) < len(units) and not isinstance(selected[0][0], HumanMessage):
+        total -= sum(message_tokens(m) for m in selected.pop(0))
+    context = [m for unit in selected for m in unit]
+    return context, {"tokens": total, "kept": len(context), "dropped": len(messages) - len(context)}
+
+
+def prompt_cache_usage(response: BaseMessage) -> Optional[Tuple[int, int]]:
+    """
+    从模型响应的 usage 中取 (前缀缓存命中 tokens, 未命中 tokens)。
+    DeepSeek 返回 prompt_cache_hit_tokens / prompt_cache_miss_tokens；
+    OpenAI 兼容格式（含流式 usage）只有 input_token_details.cache_read。没有 usage 时返回 None。
+    """
+    token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+    if "prompt_cache_hit_tokens" in token_usage:
+        return int(token_usage["prompt_cache_hit_tokens"] or 0), int(token_usage.get("prompt_cache_miss_tokens") or 0)
+    usage = getattr(response, "usage_metadata", None)
+    if not usage:
+        return None
+    hit = int((usage.get("input_token_details") or {}).get("cache_read") or 0)
+    return hit, max(int(usage.get("input_tokens") or 0) - hit, 0)
@@ -0,0 +1,154 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence
+import pymysql
+from pymysql.cursors import DictCursor
+from cache import SQLResultCache
+from config import (
+    MYSQL_ENV_PATH,
+    DB_BACKEND,
+    DB_POOL_SIZE,
+    DB_CONNECT_TIMEOUT,
+    SQL_CACHE_CAPACITY,
+    SQL_CACHE_DEFAULT_TTL,
+    SQL_CACHE_TABLE_TTL
+)
+from logger import logger
+
+
+def load_mysql_env(path: str = MYSQL_ENV_PATH) -> Dict[str, str]:
+    """读取 mcp-mysql-server/env，MCP 服务和本地连接池共用同一份连接配置。"""
+    env = {}
+    if not os.path.exists(path):
+        return env
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                try:
+                    key, value = line.split("=", 1)
+                    env[key.strip()] = value.strip()
+                except ValueError:
+                    pass
+    return env
+
+
+def to_python(value: Any) -> Any:
+    """DECIMAL 列转成 int/float，结果可以直接序列化给模型。"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+class ConnectionPool:
+    """
+    MySQL 连接池：连接按需创建、用完归还，取出时 ping 一次以自动重连。
+    skill 查询函数通过它直接执行 SQL，不再把 SQL 交给模型二次调用 MCP query 工具。
+    """
+
+    def __init__(self, env: Optional[Dict[str, str]] = None, size: int = DB_POOL_SIZE):
+        env = {**os.environ, **load_mysql_env(), **(env or {})}
+        self.params = {
+            "host": env.get("MYSQL_HOST", "localhost"),
+            "port": int(env.get("MYSQL_PORT", 3306)),
+            "user": env.get("MYSQL_USER", "root"),
+            "password": env.get("MYSQL_PASSWORD", ""),
+            "database": env.get("MYSQL_DATABASE"),
+            "charset": "utf8mb4",
+            "cursorclass": DictCursor,
+            "connect_timeout": DB_CONNECT_TIMEOUT,
+            "autocommit": True,
+        }
+        self.size = size
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "queries": 0, "errors": 0, "query_ms_total": 0.0}
+
+    def _connect(self):
+        conn = pymysql.connect(**self.params)
+        with self._lock:
+            self._stats["created"] += 1
+        return conn
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        conn = None
+        try:
+            try:
+                conn = self._idle.get_nowait()
+                conn.ping(reconnect=True)
+            except queue.Empty:
+                conn = self._connect()
+            yield conn
+        except pymysql.err.OperationalError:
+            # 连接已损坏，丢弃不归还
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._idle.put(conn)
+            self._slots.release()
+
+    def fetch_all(self, sql: str, params: Optional[Sequence] = None) -> List[Dict[str, Any]]:
+        start = time.perf_counter()
+        try:
+            with self.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(sql, params)
+                    rows = cursor.fetchall()
+        except Exception:
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats["queries"] += 1
+            self._stats["query_ms_total"] += elapsed_ms
+        logger.debug(f"SQL 执行 {elapsed_ms:.0f}ms, {len(rows)} 行: {sql} {params or ''}")
+        return [{k: to_python(v) for k, v in row.items()} for row in rows]
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["idle"] = self._idle.qsize()
+        return stats
+
+
+# MCP query 工具结果的进程级共享缓存，所有会话共用
+sql_result_cache = SQLResultCache(SQL_CACHE_CAPACITY, SQL_CACHE_DEFAULT_TTL, SQL_CACHE_TABLE_TTL)
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """skill 查询和商品目录使用的连接池；AGENT_DB_BACKEND=sqlite 时返回本地 SQLite 替身（接口相同）。"""
+    global _pool
+    if DB_BACKEND == "sqlite":
+        from db_backend import get_backend
+        return get_backend()
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
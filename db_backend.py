@@ -0,0 +1,312 @@
+"""
+进程内数据库后端：不经过 Node MCP 服务，直接在 Python 里执行 SQL，
+对模型暴露与 mcp-mysql-server 相同的 query / list_tables / describe_table 工具（返回 JSON 文本）。
+
+AGENT_DB_BACKEND 选择后端：
+    mcp     默认，走 mcp-mysql-server（Node）
+    mysql   进程内 MySQL 连接池（db.py）
+    sqlite  本地 SQLite 替身，表结构和示例数据来自 skills/database_query/references/database_schema.md，
+            用于无 MySQL / Node 环境下的测试和基准；db_queries 与商品目录也会改用它
+"""
+
+import asyncio
+import csv
+from abc import ABC, abstractmethod
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from langchain_core.tools import BaseTool, StructuredTool
+from config import DB_BACKEND, SCHEMA_DOC_PATH
+from db import ConnectionPool, to_python
+from logger import logger
+
+
+class DatabaseBackend(ABC):
+    """后端接口：子类实现同步的 fetch_all / table_names / describe，异步工具方法在线程池里调用它们。"""
+
+    name = "base"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {"queries": 0, "errors": 0, "query_ms_total": 0.0}
+
+    @abstractmethod
+    def fetch_all(self, sql: str, params: Optional[Sequence] = None) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def table_names(self) -> List[str]:
+        ...
+
+    @abstractmethod
+    def describe(self, table: str) -> List[Dict[str, Any]]:
+        ...
+
+    def _timed(self, fn, *args):
+        start = time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception:
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        with self._lock:
+            self._stats["queries"] += 1
+            self._stats["query_ms_total"] += (time.perf_counter() - start) * 1000
+        return result
+
+    async def query(self, sql: str, params: Optional[List[Any]] = None) -> str:
+        if not sql.strip().upper().startswith("SELECT"):
+            raise ValueError("Only SELECT queries are allowed with query tool")
+        rows = await asyncio.to_thread(self._timed, self.fetch_all, sql, params)
+        return _dumps(rows)
+
+    async def list_tables(self) -> str:
+        names = await asyncio.to_thread(self._timed, self.table_names)
+        key = f"Tables_in_{self.database}"
+        return _dumps([{key: n} for n in names])
+
+    async def describe_table(self, table: str) -> str:
+        return _dumps(await asyncio.to_thread(self._timed, self.describe, table))
+
+    @property
+    def database(self) -> str:
+        return "good_message_qa"
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": self.name, **self._stats}
+
+    def close(self) -> None:
+        pass
+
+
+def _dumps(rows) -> str:
+    # 与 mcp-mysql-server 的 JSON.stringify(rows, null, 2) 保持一致
+    return json.dumps(rows, ensure_ascii=False, indent=2, default=str)
+
+
+# 字符串字面量和反引号标识符：占位符转换只作用于它们之外的部分
+_SQL_QUOTED_RE = re.compile(r"('(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`)")
+
+
+def to_pyformat(sql: str) -> str:
+    """mysql2 风格的 ? 占位符转成 PyMySQL 的 %s；字面量里的 % 转义成 %%，避免参数替换时出错。"""
+    parts = _SQL_QUOTED_RE.split(sql)
+    return "".join(part.replace("%", "%%") if i % 2 else part.replace("?", "%s") for i, part in enumerate(parts))
+
+
+def to_qmark(sql: str) -> str:
+    """PyMySQL 风格的 %s 占位符转成 SQLite 的 ?，字面量（如 LIKE '%s...'）保持不变。"""
+    parts = _SQL_QUOTED_RE.split(sql)
+    return "".join(part if i % 2 else part.replace("%s", "?") for i, part in enumerate(parts))
+
+
+class MySQLBackend(DatabaseBackend):
+    """进程内 MySQL：复用 db.py 的连接池，省掉 stdio JSON-RPC 和 Node 进程。"""
+
+    name = "mysql"
+
+    def __init__(self, pool: ConnectionPool):
+        super().__init__()
+        self.pool = pool
+
+    @property
+    def database(self) -> str:
+        return self.pool.params.get("database") or ""
+
+    def fetch_all(self, sql, params=None):
+        # 与 MCP query 工具一致接受 ? 占位符；没有参数时 PyMySQL 不做替换，SQL 原样执行
+        return self.pool.fetch_all(to_pyformat(sql) if params else sql, params)
+
+    def table_names(self):
+        return [next(iter(row.values())) for row in self.pool.fetch_all("SHOW TABLES")]
+
+    def describe(self, table):
+        return self.pool.fetch_all(f"DESCRIBE `{table.replace('`', '``')}`")
+
+    def stats(self):
+        return {**super().stats(), "pool": self.pool.stats()}
+
+    def close(self):
+        self.pool.close()
+
+
+_TABLE_HEADING_RE = re.compile(r"^###\s*\d+\.\s*([^\s(（]+)")
+_FIELDS_RE = re.compile(r"^\*\*字段\*\*[:：]\s*(.+)$")
+NUMERIC_COLUMNS = {"价格", "底价", "费用", "序列"}
+
+
+def parse_schema_doc(path: str = SCHEMA_DOC_PATH) -> List[Tuple[str, List[str], List[List[str]]]]:
+    """从 database_schema.md 解析 (表名, 字段, 示例数据行)。"""
+    tables = []
+    current = None
+    in_sample, in_block = False, False
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith("## ") and current is not None:
+            break
+        heading = _TABLE_HEADING_RE.match(stripped)
+        if heading:
+            current = (heading.group(1), [], [])
+            tables.append(current)
+            in_sample = in_block = False
+            continue
+        if current is None:
+            continue
+        fields = _FIELDS_RE.match(stripped)
+        if fields:
+            current[1].extend(c.strip() for c in re.split(r"[,，]", fields.group(1)) if c.strip())
+        elif stripped.startswith("**示例数据**"):
+            in_sample = True
+        elif stripped.startswith("```") and in_sample:
+            in_block = not in_block
+            if not in_block:
+                in_sample = False
+        elif in_block and stripped:
+            row = next(csv.reader([stripped]))
+            if row != current[1]:
+                current[2].append(row)
+    return tables
+
+
+def _column_type(name: str, values: List[str]) -> str:
+    def is_number(v):
+        try:
+            float(v)
+            return True
+        except ValueError:
+            return False
+    if name in NUMERIC_COLUMNS or (values and all(is_number(v) for v in values)):
+        return "NUMERIC"
+    # 与 MySQL *_ci 排序规则一致：文本比较忽略大小写
+    return "TEXT COLLATE NOCASE"
+
+
+class SQLiteBackend(DatabaseBackend):
+    """
+    SQLite 替身：按 database_schema.md 建表并写入示例数据。
+    MySQL 风格的 %s 占位符（字面量之外）会转换成 ?，反引号标识符 SQLite 原生支持。
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = ":memory:", schema_path: Optional[str] = SCHEMA_DOC_PATH):
+        super().__init__()
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._db_lock = threading.Lock()
+        if schema_path and os.path.exists(schema_path):
+            self.load_schema(schema_path)
+
+    def load_schema(self, schema_path: str) -> None:
+        tables = parse_schema_doc(schema_path)
+        with self._db_lock, self.conn:
+            for table, columns, rows in tables:
+                if not columns:
+                    continue
+                cols = ", ".join(
+                    f'"{c}" {_column_type(c, [r[i] for r in rows if i < len(r)])}' for i, c in enumerate(columns)
+                )
+                self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({cols})')
+                placeholders = ", ".join("?" for _ in columns)
+                self.conn.executemany(
+                    f'INSERT INTO "{table}" VALUES ({placeholders})',
+                    [(row + [None] * len(columns))[:len(columns)] for row in rows],
+                )
+        logger.info(f"SQLite 替身已加载: {[(t, len(r)) for t, _, r in tables]}")
+
+    def fetch_all(self, sql, params=None):
+        with self._db_lock:
+            cursor = self.conn.execute(to_qmark(sql), tuple(params or ()))
+            rows = cursor.fetchall()
+        return [{k: _sqlite_value(row[k]) for k in row.keys()} for row in rows]
+
+    def execute(self, sql: str, params: Optional[Sequence] = None) -> int:
+        """测试和基准用：写入或修改替身数据。"""
+        with self._db_lock, self.conn:
+            return self.conn.execute(to_qmark(sql), tuple(params or ())).rowcount
+
+    def table_names(self):
+        with self._db_lock:
+            rows = self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name").fetchall()
+        return [r["name"] for r in rows]
+
+    def describe(self, table):
+        with self._db_lock:
+            rows = self.conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+        if not rows:
+            raise ValueError(f"Table '{table}' doesn't exist")
+        return [
+            {
+                "Field": r["name"],
+                "Type": r["type"],
+                "Null": "NO" if r["notnull"] else "YES",
+                "Key": "PRI" if r["pk"] else "",
+                "Default": r["dflt_value"],
+                "Extra": "",
+            }
+            for r in rows
+        ]
+
+    def close(self):
+        with self._db_lock:
+            self.conn.close()
+
+
+def _sqlite_value(value: Any) -> Any:
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return to_python(value)
+
+
+def build_db_tools(backend: DatabaseBackend) -> List[BaseTool]:
+    """生成与 mcp-mysql-server 同名同参数的工具，供模型无感切换后端。"""
+
+    async def query(sql: str, params: Optional[List[Any]] = None) -> str:
+        return await backend.query(sql, params)
+
+    async def list_tables() -> str:
+        return await backend.list_tables()
+
+    async def describe_table(table: str) -> str:
+        return await backend.describe_table(table)
+
+    return [
+        StructuredTool.from_function(
+            coroutine=query,
+            name="query",
+            description="Execute a SELECT query,can not get table structure,use describe_table tool to get table structure",
+        ),
+        StructuredTool.from_function(coroutine=list_tables, name="list_tables", description="List all tables in the database"),
+        StructuredTool.from_function(coroutine=describe_table, name="describe_table", description="Get table structure"),
+    ]
+
+
+_backend: Optional[DatabaseBackend] = None
+_backend_lock = threading.Lock()
+
+
+def open_backend(kind: str = DB_BACKEND) -> DatabaseBackend:
+    if kind == "sqlite":
+        return SQLiteBackend()
+    if kind == "mysql":
+        from db import get_pool
+        return MySQLBackend(get_pool())
+    raise ValueError(f"不支持的进程内数据库后端: {kind}")
+
+
+def get_backend() -> DatabaseBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = open_backend()
+    return _backend
@@ -0,0 +1,111 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import List, Optional
+from chromadb.utils import embedding_functions
+import dashscope
+from dashscope import TextEmbedding
+from config import (
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_DIMENSION,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_CONCURRENCY,
+    EMBEDDING_MAX_RETRIES,
+    EMBEDDING_RETRY_BASE_DELAY,
+    EMBEDDING_CACHE_ENABLED,
+    DASHSCOPE_API_KEY
+)
+from embedding_cache import EmbeddingCache, get_embedding_cache
+from logger import logger
+
+
+THROTTLE_CODES = ("Throttling", "Throttling.RateQuota", "Throttling.AllocationQuota")
+
+
+def _is_retryable(resp) -> bool:
+    status = getattr(resp, "status_code", None)
+    code = getattr(resp, "code", "") or ""
+    if status == HTTPStatus.TOO_MANY_REQUESTS or code in THROTTLE_CODES:
+        return True
+    return isinstance(status, int) and status >= 500
+
+
+class AliyunEmbeddingFunction(embedding_functions.EmbeddingFunction):
+    """
+    DashScope 文本向量化：按 batch_size 分批，最多 max_concurrency 个批次并发请求，
+    限流/服务端错误时指数退避重试，输出顺序与输入一致。
+    已缓存的文本直接从磁盘缓存读取，只有未命中的文本才会发起网络请求。
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME,
+                 dimension: int = EMBEDDING_DIMENSION,
+                 api_key: str = DASHSCOPE_API_KEY,
+                 batch_size: int = EMBEDDING_BATCH_SIZE,
+                 max_concurrency: int = EMBEDDING_MAX_CONCURRENCY,
+                 max_retries: int = EMBEDDING_MAX_RETRIES,
+                 cache: Optional[EmbeddingCache] = None,
+                 use_cache: bool = EMBEDDING_CACHE_ENABLED):
+        self.model_name = model_name
+        self.dimension = dimension
+        self.api_key = api_key
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        if cache is None and use_cache:
+            cache = get_embedding_cache(model_name, dimension)
+        self.cache = cache
+        if self.api_key:
+            dashscope.api_key = self.api_key
+        else:
+            raise ValueError("DASHSCOPE_API_KEY is required. Please set it in .env file.")
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            resp = TextEmbedding.call(
+                model=self.model_name,
+                input=batch,
+                dimension=self.dimension
+            )
+            if resp.status_code == HTTPStatus.OK:
+                items = sorted(resp.output["embeddings"], key=lambda x: x["text_index"])
+                return [item["embedding"] for item in items]
+            if attempt < self.max_retries and _is_retryable(resp):
+                delay = EMBEDDING_RETRY_BASE_DELAY * (2 ** attempt) + random.uniform(0, 0.1)
+                logger.warning(f"Embedding 请求被限流或失败 ({resp.status_code} {getattr(resp, 'code', '')})，{delay:.2f}s 后重试")
+                time.sleep(delay)
+                continue
+            raise RuntimeError(f"Embedding request failed: {resp}")
+        raise RuntimeError("Embedding request failed: retries exhausted")
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        texts = list(input)
+        if not texts:
+            return []
+        if self.cache is None:
+            return self._embed_texts(texts)
+
+        results = self.cache.get_many(texts)
+        missing = [i for i, vec in enumerate(results) if vec is None]
+        if missing:
+            # 同一批次里重复的文本只请求一次
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+            vectors = self._embed_texts(unique_texts)
+            self.cache.put_many(unique_texts, vectors)
+            by_text = dict(zip(unique_texts, vectors))
+            for i in missing:
+                results[i] = by_text[texts[i]]
+        return results
+
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            return self._embed_batch(batches[0])
+
+        all_embeddings = []
+        workers = min(self.max_concurrency, len(batches))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # map 保证结果按批次顺序返回
+            for vectors in pool.map(self._embed_batch, batches):
+                all_embeddings.extend(vectors)
+        return all_embeddings
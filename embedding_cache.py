@@ -0,0 +1,206 @@
+import hashlib
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence
+from config import EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_BYTES
+from logger import logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+KEY_BYTES = 20  # sha1 digest
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    内容寻址的向量磁盘缓存。每个 (模型, 维度) 对应一个二进制文件，
+    记录格式为 [20 字节 sha1(text)][dimension 个 float32]，只追加写入；
+    文件超过 max_bytes 时按最近使用顺序压缩，丢弃最久未用的条目。
+
+    agent 与 build_rag.py / build_multimodal_kb.py 可能同时读写同一文件：
+    追加和压缩都在 <文件>.lock 的排他锁内进行，每批记录一次 write 写入；
+    读取前按 inode / 大小检查文件，被其他进程压缩替换或追加过时重新建立偏移索引。
+    """
+
+    def __init__(self, model_name: str, dimension: int,
+                 cache_dir: str = EMBEDDING_CACHE_DIR,
+                 max_bytes: int = EMBEDDING_CACHE_MAX_BYTES):
+        self.model_name = model_name
+        self.dimension = dimension
+        self.max_bytes = max_bytes
+        self.record_size = KEY_BYTES + dimension * 4
+        safe_model = model_name.replace("/", "_").replace("\\", "_")
+        self.path = os.path.join(cache_dir, f"{safe_model}_{dimension}.bin")
+        self.lock_path = self.path + ".lock"
+        self._offsets: "OrderedDict[bytes, int]" = OrderedDict()
+        # 偏移索引对应的文件 inode 和已索引到的字节数
+        self._inode: Optional[int] = None
+        self._indexed = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        with self._lock:
+            self._refresh()
+
+    @contextmanager
+    def _file_lock(self):
+        """跨进程排他锁；没有 fcntl 的平台（Windows）只靠进程内锁和单次 write。"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a+b") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _sync(self, f) -> None:
+        """让偏移索引与打开的文件 f 一致：换了文件（被压缩替换）或变短时全部重建，变长时只索引新增的完整记录。"""
+        st = os.fstat(f.fileno())
+        if st.st_ino != self._inode or st.st_size < self._indexed:
+            if self._inode is not None:
+                self.reloads += 1
+            self._offsets.clear()
+            self._inode = st.st_ino
+            self._indexed = 0
+        valid = st.st_size - st.st_size % self.record_size
+        batch = self.record_size * 1024
+        offset = self._indexed
+        while offset < valid:
+            f.seek(offset)
+            block = f.read(min(batch, valid - offset))
+            for pos in range(0, len(block) - self.record_size + 1, self.record_size):
+                key = block[pos:pos + KEY_BYTES]
+                self._offsets.pop(key, None)
+                self._offsets[key] = offset + pos
+            offset += len(block) - len(block) % self.record_size
+        self._indexed = valid
+
+    def _refresh(self) -> None:
+        try:
+            with open(self.path, "rb") as f:
+                self._sync(f)
+        except FileNotFoundError:
+            self._offsets.clear()
+            self._inode = None
+            self._indexed = 0
+
+    def _read_vector(self, f, offset: int) -> List[float]:
+        f.seek(offset + KEY_BYTES)
+        vec = array("f")
+        vec.frombytes(f.read(self.dimension * 4))
+        return vec.tolist()
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        keys = [text_key(t) for t in texts]
+        out: List[Optional[List[float]]] = [None] * len(texts)
+        with self._lock:
+            found = []
+            try:
+                with open(self.path, "rb") as f:
+                    # 偏移只对当前打开的这个文件有效，先核对再读
+                    self._sync(f)
+                    found = [(i, self._offsets[k]) for i, k in enumerate(keys) if k in self._offsets]
+                    for i, offset in found:
+                        out[i] = self._read_vector(f, offset)
+                        self._offsets.move_to_end(keys[i])
+            except FileNotFoundError:
+                self._offsets.clear()
+                self._inode = None
+                self._indexed = 0
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+        return out
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        with self._lock, self._file_lock():
+            # 追加模式 + 无缓冲：每次 write 都写到文件末尾
+            with open(self.path, "a+b", buffering=0) as f:
+                self._sync(f)
+                size = os.fstat(f.fileno()).st_size
+                if size != self._indexed:
+                    # 上次写入中断留下的半条记录，截掉以保持记录对齐
+                    f.truncate(self._indexed)
+                chunk = bytearray()
+                new_keys = []
+                for text, vec in zip(texts, vectors):
+                    key = text_key(text)
+                    if key in self._offsets or key in new_keys or len(vec) != self.dimension:
+                        continue
+                    chunk += key
+                    chunk += array("f", vec).tobytes()
+                    new_keys.append(key)
+                if not new_keys:
+                    return
+                written = 0
+                while written < len(chunk):
+                    written += f.write(chunk[written:])
+                end = f.tell()
+                offset = end - len(chunk)
+                for key in new_keys:
+                    self._offsets[key] = offset
+                    offset += self.record_size
+                if end - len(chunk) == self._indexed:
+                    self._indexed = end
+                if end > self.max_bytes:
+                    self._compact(f)
+
+    def _compact(self, src) -> None:
+        keep = max(1, int(self.max_bytes * 0.8) // self.record_size)
+        survivors = list(self._offsets.items())[-keep:]
+        tmp_path = self.path + ".tmp"
+        new_offsets: "OrderedDict[bytes, int]" = OrderedDict()
+        with open(tmp_path, "wb") as dst:
+            for key, offset in survivors:
+                src.seek(offset)
+                new_offsets[key] = dst.tell()
+                dst.write(src.read(self.record_size))
+            dst.flush()
+            os.fsync(dst.fileno())
+            inode = os.fstat(dst.fileno()).st_ino
+            size = dst.tell()
+        os.replace(tmp_path, self.path)
+        logger.info(f"Embedding 缓存压缩: {len(self._offsets)} -> {len(new_offsets)} 条")
+        self._offsets = new_offsets
+        self._inode = inode
+        self._indexed = size
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._offsets),
+                "bytes": len(self._offsets) * self.record_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+            }
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+
+_caches: Dict[tuple, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(model_name: str, dimension: int) -> EmbeddingCache:
+    key = (model_name, dimension)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = EmbeddingCache(model_name, dimension)
+            _caches[key] = cache
+        return cache
@@ -0,0 +1,136 @@
+import json
+import math
+import os
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from cache import normalize_query
+from config import CHROMA_PATH
+
+
+def tokenize(text: str) -> List[str]:
+    """字符二元组切分；中文短句不依赖分词器也能匹配 "20点触摸"、"发票" 这类关键词。"""
+    norm = normalize_query(text)
+    if len(norm) < 2:
+        return [norm] if norm else []
+    return [norm[i:i + 2] for i in range(len(norm) - 1)]
+
+
+def index_path(name: str, chroma_path: str = CHROMA_PATH) -> str:
+    return os.path.join(chroma_path, f"{name}.lexical.json")
+
+
+class LexicalIndex:
+    """
+    基于字符二元组的 BM25 倒排索引，与向量集合同步构建，保存文档原文以便直接返回结果。
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict] = []
+        self.doc_lens: List[int] = []
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.avgdl = 0.0
+
+    @classmethod
+    def build(cls, ids: List[str], documents: List[str], metadatas: List[Dict]) -> "LexicalIndex":
+        index = cls()
+        index.ids = list(ids)
+        index.documents = list(documents)
+        index.metadatas = list(metadatas)
+        for i, doc in enumerate(documents):
+            terms = Counter(tokenize(doc))
+            index.doc_lens.append(sum(terms.values()))
+            for term, tf in terms.items():
+                index.postings.setdefault(term, {})[i] = tf
+        index.avgdl = sum(index.doc_lens) / len(index.doc_lens) if index.doc_lens else 0.0
+        return index
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        n = len(self.ids)
+        if not n:
+            return []
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for i, tf in posting.items():
+                denom = tf + self.k1 * (1 - self.b + self.b * self.doc_lens[i] / self.avgdl)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (self.k1 + 1) / denom
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+
+    def coverage(self, query: str, doc_index: int) -> float:
+        terms = set(tokenize(query))
+        if not terms:
+            return 0.0
+        matched = sum(1 for t in terms if doc_index in self.postings.get(t, {}))
+        return matched / len(terms)
+
+    def doc_coverage(self, query: str, doc_index: int) -> float:
+        """文档（检索键）的关键词中出现在查询里的比例。"""
+        doc_terms = set(tokenize(self.documents[doc_index]))
+        if not doc_terms:
+            return 0.0
+        return len(doc_terms & set(tokenize(query))) / len(doc_terms)
+
+    def is_confident(self, query: str, hits: List[Tuple[int, float]], margin: float, min_terms: int,
+                     min_doc_coverage: float) -> bool:
+        """
+        查询至少有 min_terms 个关键词、最高分文档覆盖了查询的全部关键词、文档自身的关键词也大部分
+        （不低于 min_doc_coverage）出现在查询里，且明显领先第二名时，认为词法结果可直接采用。
+        "质保"、"55寸" 这类只有一两个二元组的短查询区分度太低；"质保多久" 只是 "屏幕质保多久" 的一部分，
+        也不能直接采用，都交给向量检索。
+        """
+        if not hits or len(set(tokenize(query))) < min_terms or self.coverage(query, hits[0][0]) < 1.0:
+            return False
+        if self.doc_coverage(query, hits[0][0]) < min_doc_coverage:
+            return False
+        return len(hits) == 1 or hits[0][1] >= margin * hits[1][1]
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "ids": self.ids,
+            "documents": self.documents,
+            "metadatas": self.metadatas,
+            "doc_lens": self.doc_lens,
+            "postings": {t: [[i, tf] for i, tf in p.items()] for t, p in self.postings.items()},
+        }
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["LexicalIndex"]:
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if "postings" not in data:
+            return cls.build(data.get("ids", []), data.get("documents", []), data.get("metadatas", []))
+        index = cls(data.get("k1", 1.5), data.get("b", 0.75))
+        index.ids = data["ids"]
+        index.documents = data["documents"]
+        index.metadatas = data["metadatas"]
+        index.doc_lens = data["doc_lens"]
+        index.postings = {t: {i: tf for i, tf in p} for t, p in data["postings"].items()}
+        index.avgdl = sum(index.doc_lens) / len(index.doc_lens) if index.doc_lens else 0.0
+        return index
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda d: scores[d], reverse=True)
@@ -0,0 +1,214 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+from langchain_core.tools import BaseTool, StructuredTool
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import load_mcp_tools
+from config import MCP_POOL_SIZE, MCP_HEALTH_CHECK_INTERVAL, MCP_START_TIMEOUT
+from logger import logger
+
+
+class _SessionSlot:
+    """
+    一个常驻的 MCP stdio 会话（对应一个 Node 子进程）。
+    会话在自己的后台任务里打开和关闭，避免跨任务退出 anyio 的 cancel scope。
+    """
+
+    def __init__(self, client: MultiServerMCPClient, server_name: str, index: int):
+        self.client = client
+        self.server_name = server_name
+        self.index = index
+        self.session = None
+        self.tools: Dict[str, BaseTool] = {}
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._error: Optional[BaseException] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def open(self):
+        self._ready.clear()
+        self._closing.clear()
+        self._error = None
+        self._task = asyncio.create_task(self._run(), name=f"mcp-{self.server_name}-{self.index}")
+        await asyncio.wait_for(self._ready.wait(), MCP_START_TIMEOUT)
+        if self._error is not None:
+            raise self._error
+
+    async def _run(self):
+        try:
+            async with self.client.session(self.server_name) as session:
+                tools = await load_mcp_tools(session)
+                self.session = session
+                self.tools = {t.name: t for t in tools}
+                self._ready.set()
+                await self._closing.wait()
+        except Exception as e:
+            self._error = e
+            logger.error(f"MCP 会话 {self.server_name}#{self.index} 异常退出: {e}")
+        finally:
+            self.session = None
+            self._ready.set()
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def close(self):
+        self._closing.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, 5)
+            except Exception:
+                self._task.cancel()
+        self._task = None
+        self.session = None
+
+
+class MCPSessionPool:
+    """
+    进程级 MCP 会话池：启动时打开 pool_size 个常驻 stdio 会话，工具调用复用这些会话，
+    不再像 client.get_tools() 返回的工具那样每次调用都拉起一个新的 Node 进程和 MySQL 连接。
+    后台定期 ping 做健康检查，会话失效或调用出现连接错误时自动重连。
+    """
+
+    def __init__(self, client: MultiServerMCPClient, server_name: str = "mysql", pool_size: int = MCP_POOL_SIZE):
+        self.client = client
+        self.server_name = server_name
+        self.pool_size = max(1, pool_size)
+        self.slots: List[_SessionSlot] = []
+        self.tools: List[BaseTool] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self._stats: Dict[str, Any] = {
+            "spawns": 0,
+            "reconnects": 0,
+            "health_checks": 0,
+            "health_failures": 0,
+            "calls": 0,
+            "errors": 0,
+            "tools": {},
+        }
+
+    async def start(self) -> "MCPSessionPool":
+        self._idle = asyncio.Queue()
+        for i in range(self.pool_size):
+            slot = _SessionSlot(self.client, self.server_name, i)
+            await self._open(slot)
+            self.slots.append(slot)
+            self._idle.put_nowait(slot)
+        self.tools = [self._proxy_tool(t) for t in self.slots[0].tools.values()]
+        if MCP_HEALTH_CHECK_INTERVAL:
+            self._health_task = asyncio.create_task(self._health_loop(), name="mcp-health")
+        logger.info(f"MCP 会话池就绪: {self.pool_size} 个常驻会话, 工具 {[t.name for t in self.tools]}")
+        return self
+
+    async def _open(self, slot: _SessionSlot):
+        self._stats["spawns"] += 1
+        start = time.perf_counter()
+        await slot.open()
+        logger.info(f"MCP 会话 {self.server_name}#{slot.index} 已启动 ({(time.perf_counter() - start) * 1000:.0f}ms)")
+
+    async def _reconnect(self, slot: _SessionSlot):
+        logger.warning(f"MCP 会话 {self.server_name}#{slot.index} 重连中...")
+        self._stats["reconnects"] += 1
+        await slot.close()
+        await self._open(slot)
+
+    def _proxy_tool(self, tool: BaseTool) -> BaseTool:
+        """对外暴露的工具：名称、描述、参数与 MCP 工具一致，调用时从池里取当前可用的会话执行。"""
+        name = tool.name
+
+        async def call(**kwargs):
+            return await self.call_tool(name, kwargs)
+
+        return StructuredTool(
+            name=name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            coroutine=call,
+            metadata=tool.metadata,
+        )
+
+    async def call_tool(self, name: str, args: Dict[str, Any]) -> Any:
+        slot = await self._idle.get()
+        start = time.perf_counter()
+        try:
+            if not slot.alive:
+                await self._reconnect(slot)
+            try:
+                return await slot.tools[name].ainvoke(args)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                raise
+            except Exception as e:
+                self._stats["errors"] += 1
+                # 会话还能 ping 通说明是工具本身的错误；否则是连接断开，重连后重试一次
+                if await self._ping(slot):
+                    raise
+                logger.warning(f"MCP 工具 {name} 调用时会话断开: {e}")
+                await self._reconnect(slot)
+                return await slot.tools[name].ainvoke(args)
+        finally:
+            self._record(name, (time.perf_counter() - start) * 1000)
+            self._idle.put_nowait(slot)
+
+    def _record(self, name: str, elapsed_ms: float):
+        self._stats["calls"] += 1
+        tool_stats = self._stats["tools"].setdefault(name, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0})
+        tool_stats["calls"] += 1
+        tool_stats["total_ms"] += elapsed_ms
+        tool_stats["max_ms"] = max(tool_stats["max_ms"], elapsed_ms)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(MCP_HEALTH_CHECK_INTERVAL)
+            # 只检查空闲会话，正在执行调用的会话不打断；ping 期间其他调用可能取走了剩下的空闲会话
+            for _ in range(self._idle.qsize()):
+                try:
+                    slot = self._idle.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                try:
+                    await self.check(slot)
+                finally:
+                    self._idle.put_nowait(slot)
+
+    async def _ping(self, slot: _SessionSlot) -> bool:
+        try:
+            if not slot.alive:
+                return False
+            await asyncio.wait_for(slot.session.send_ping(), 5)
+            return True
+        except Exception:
+            return False
+
+    async def check(self, slot: _SessionSlot) -> bool:
+        self._stats["health_checks"] += 1
+        if await self._ping(slot):
+            return True
+        self._stats["health_failures"] += 1
+        logger.warning(f"MCP 会话 {self.server_name}#{slot.index} 健康检查失败")
+        try:
+            await self._reconnect(slot)
+        except Exception as e:
+            logger.error(f"MCP 会话重连失败: {e}")
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        tools = {
+            name: {**s, "avg_ms": round(s["total_ms"] / s["calls"], 1) if s["calls"] else 0.0}
+            for name, s in self._stats["tools"].items()
+        }
+        return {
+            **self._stats,
+            "tools": tools,
+            "pool_size": self.pool_size,
+            "alive": sum(1 for s in self.slots if s.alive),
+        }
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for slot in self.slots:
+            await slot.close()
+        logger.info(f"MCP 会话池已关闭: {self.stats()}")
@@ -0,0 +1,81 @@
+import json
+import os
+from typing import Dict, List, Optional, Set
+from cache import normalize_query
+from config import CHROMA_PATH
+from media_tags import MEDIA_TAGS
+
+
+TAG_INDEX_NAME = "kb_media_tags"
+TAG_INDEX_PATH = os.path.join(CHROMA_PATH, f"{TAG_INDEX_NAME}.json")
+
+# 模态词只用来筛选图片/视频，不作为命中依据
+MODALITY_TAGS = {"图片": "image", "照片": "image", "视频": "video", "演示": "video"}
+# 每个素材都带的默认标签（如 "一体机"）区分不出素材，不进入倒排索引
+GENERIC_TAGS = {normalize_query(t) for rules in MEDIA_TAGS.values() for t in rules.get("default", [])} | set(MODALITY_TAGS)
+
+
+def query_modalities(query: str) -> Set[str]:
+    """查询里的模态词对应的素材类型（image / video），没有模态词时为空集合。"""
+    norm = normalize_query(query)
+    return {modality for word, modality in MODALITY_TAGS.items() if word in norm}
+
+
+class MediaTagIndex:
+    """
+    标签 -> 素材的倒排索引，由 build_multimodal_kb.py 按 media_tags.py 解析出的确定性标签生成。
+    查询中出现具体的场景/产品标签时直接定位素材，无需向量检索；模态词和默认标签不参与命中。
+    """
+
+    def __init__(self, assets: Optional[List[Dict]] = None):
+        self.assets: List[Dict] = assets or []
+        self.tags: Dict[str, List[int]] = {}
+        for i, asset in enumerate(self.assets):
+            for tag in asset.get("tags", []):
+                key = normalize_query(tag)
+                if key and key not in GENERIC_TAGS:
+                    self.tags.setdefault(key, []).append(i)
+        # 长标签优先匹配，避免 "双系统" 被 "系统" 之类的短标签抢先
+        self._ordered_tags = sorted(self.tags, key=len, reverse=True)
+
+    def __len__(self) -> int:
+        return len(self.assets)
+
+    def match(self, query: str, top_k: int = 3) -> List[Dict]:
+        norm = normalize_query(query)
+        matched = [tag for tag in self._ordered_tags if tag in norm]
+        if not matched:
+            return []
+        modalities = query_modalities(query)
+
+        scores: Dict[int, int] = {}
+        for tag in matched:
+            for i in self.tags[tag]:
+                scores[i] = scores.get(i, 0) + 1
+        if modalities:
+            scores = {i: n for i, n in scores.items() if self.assets[i].get("modality") in modalities}
+        if not scores:
+            return []
+
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], len(self.assets[x[0]].get("tags", []))))
+        out = []
+        for i, n in ranked[:top_k]:
+            asset = dict(self.assets[i])
+            asset["matched_tags"] = [t for t in matched if i in self.tags[t]]
+            out.append(asset)
+        return out
+
+    def save(self, path: str = TAG_INDEX_PATH) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"assets": self.assets, "tags": self.tags}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = TAG_INDEX_PATH) -> Optional["MediaTagIndex"]:
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("assets", []))
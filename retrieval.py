@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+import chromadb
+from config import CHROMA_PATH, VECTOR_BACKEND
+from embedding import AliyunEmbeddingFunction
+from logger import logger
+from lexical_index import LexicalIndex, index_path
+from media_index import MediaTagIndex, TAG_INDEX_NAME
+from vector_store import VectorStore, open_store
+
+
+class RetrievalEngine:
+    """
+    进程级检索引擎：持有一个常驻的向量存储后端（Chroma client 或内存映射索引）、
+    embedding 函数和集合句柄，供所有会话共享，避免每次工具调用都重新建立连接。
+    """
+
+    def __init__(self, chroma_path: str = CHROMA_PATH, backend: str = VECTOR_BACKEND):
+        self.chroma_path = chroma_path
+        self.backend = backend
+        self.client = None
+        self.embedding_fn = None
+        self._collections: Dict[str, Any] = {}
+        # 词法索引与媒体标签索引，随集合版本失效
+        self._lexical: Dict[str, Any] = {}
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="retrieval")
+        self._stats = {
+            "open_ms": 0.0,
+            "queries": 0,
+            "query_ms_total": 0.0,
+            "query_ms_last": 0.0,
+        }
+
+    @property
+    def is_open(self) -> bool:
+        return self.embedding_fn is not None
+
+    def open(self) -> "RetrievalEngine":
+        with self._lock:
+            if self.embedding_fn is not None:
+                return self
+            start = time.perf_counter()
+            if self.backend == "chroma":
+                os.makedirs(self.chroma_path, exist_ok=True)
+                self.client = chromadb.PersistentClient(path=self.chroma_path)
+            self.embedding_fn = AliyunEmbeddingFunction()
+            self._stats["open_ms"] = (time.perf_counter() - start) * 1000
+            logger.info(f"检索引擎已打开: backend={self.backend}, 耗时 {self._stats['open_ms']:.1f}ms")
+            return self
+
+    def close(self) -> None:
+        with self._lock:
+            self._collections.clear()
+            self._lexical.clear()
+            self.client = None
+            self.embedding_fn = None
+
+    def store(self, name: str) -> VectorStore:
+        handle = self._collections.get(name)
+        if handle is not None:
+            return handle
+        with self._lock:
+            if self.embedding_fn is None:
+                self.open()
+            handle = self._collections.get(name)
+            if handle is None:
+                handle = open_store(name, self.embedding_fn, client=self.client, backend=self.backend)
+                self._collections[name] = handle
+            return handle
+
+    def collection_version(self, name: str) -> int:
+        """
+        返回集合的版本戳（由构建脚本通过 bump_collection_version 更新）。
+        版本变化时丢弃旧的集合句柄，下次访问重新解析。
+        """
+        version = collection_version(name, self.chroma_path)
+        if self._versions.get(name) != version:
+            with self._lock:
+                if self._versions.get(name) != version:
+                    self._collections.pop(name, None)
+                    self._lexical.pop(name, None)
+                    self._versions[name] = version
+        return version
+
+    def lexical_index(self, name: str) -> Optional[LexicalIndex]:
+        if name in self._lexical:
+            return self._lexical[name]
+        with self._lock:
+            if name not in self._lexical:
+                self._lexical[name] = LexicalIndex.load(index_path(name, self.chroma_path))
+            return self._lexical[name]
+
+    def tag_index(self) -> Optional[MediaTagIndex]:
+        self.collection_version(TAG_INDEX_NAME)
+        if TAG_INDEX_NAME in self._lexical:
+            return self._lexical[TAG_INDEX_NAME]
+        with self._lock:
+            if TAG_INDEX_NAME not in self._lexical:
+                self._lexical[TAG_INDEX_NAME] = MediaTagIndex.load()
+            return self._lexical[TAG_INDEX_NAME]
+
+    def count(self, name: str) -> int:
+        return self.store(name).count()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if self.embedding_fn is None:
+            self.open()
+        return self.embedding_fn(texts)
+
+    def query(self, name: str, query_texts: Optional[List[str]] = None, n_results: int = 3,
+              include: Optional[List[str]] = None,
+              query_embeddings: Optional[List[List[float]]] = None) -> Dict[str, Any]:
+        store = self.store(name)
+        if query_embeddings is None:
+            query_embeddings = self.embed(query_texts)
+        start = time.perf_counter()
+        result = store.query(query_embeddings, n_results, include)
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats["queries"] += 1
+            self._stats["query_ms_total"] += elapsed
+            self._stats["query_ms_last"] = elapsed
+        logger.debug(f"检索 {name}: {elapsed:.1f}ms")
+        return result
+
+    def query_many(self, names: List[str], query_embeddings: List[List[float]], n_results: int,
+                   include: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """用同一个查询向量并行检索多个集合，返回 {集合名: 结果}。"""
+        futures = {
+            name: self._pool.submit(self.query, name, None, n_results, include, query_embeddings)
+            for name in names
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            out = dict(self._stats)
+        out["query_ms_avg"] = out["query_ms_total"] / out["queries"] if out["queries"] else 0.0
+        return out
+
+
+def _version_path(name: str, chroma_path: str) -> str:
+    return os.path.join(chroma_path, f"{name}.version")
+
+
+def collection_version(name: str, chroma_path: str = CHROMA_PATH) -> int:
+    try:
+        return os.stat(_version_path(name, chroma_path)).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def bump_collection_version(name: str, chroma_path: str = CHROMA_PATH) -> None:
+    os.makedirs(chroma_path, exist_ok=True)
+    with open(_version_path(name, chroma_path), "w", encoding="utf-8") as f:
+        f.write(str(time.time_ns()))
+
+
+_engine: Optional[RetrievalEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> RetrievalEngine:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RetrievalEngine()
+    return _engine
+
+
+def open_engine() -> RetrievalEngine:
+    return get_engine().open()
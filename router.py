@@ -0,0 +1,116 @@
+import re
+import threading
+from typing import Dict, List, Optional
+from langchain_core.messages import AIMessage
+from cache import normalize_query
+from catalog import catalog_snapshot
+
+
+# 话术模板，与 system_prompt.txt 中的固定流程保持一致
+OPENING = "您好，需要购买一体机吗，咱们是用来教学使用，还是会议呀？"
+ASK_REMOTE = "需要经常远程会议吗？"
+ASK_SIZE = "您这边需要多大尺寸的呢？"
+ASK_STAND = "您这边是要移动推车，还是要壁挂（挂墙上）呢？"
+
+GREETINGS = {
+    "你好", "您好", "在吗", "在不在", "在么", "hi", "hello", "哈喽", "你好在吗", "您好在吗",
+    "你好呀", "您好呀", "有人吗", "老板", "老板在吗", "亲", "亲在吗",
+}
+YES_WORDS = {"是", "是的", "经常", "要", "需要", "对", "对的", "嗯", "嗯嗯", "会", "经常会", "经常用", "有", "会的"}
+NO_WORDS = {"不", "不是", "不用", "不需要", "不经常", "偶尔", "很少", "不会", "没有", "一般", "不常", "不太经常", "基本不用"}
+
+MEETING_RE = re.compile(r"^(公司|单位)?(开会|会议|会议室)(用|使用|用的|使用的|的)?(吧|呀|啊|哦)?$")
+TEACHING_RE = re.compile(r"^(学校|上课|教学|培训|老师|教室|学生)(用|使用|用的|使用的|的)?(吧|呀|啊|哦)?$")
+SIZE_RE = re.compile(r"^(要)?(\d{2,3})(寸|英寸)?(的)?(吧|呀|啊|哦)?$")
+
+
+def last_ai_reply(messages: List) -> str:
+    for msg in reversed(messages):
+        if isinstance(msg, AIMessage) and not getattr(msg, "tool_calls", None):
+            return msg.content or ""
+    return ""
+
+
+def detect_stage(messages: List) -> str:
+    """根据上一条客服回复判断当前处在话术流程的哪一步。"""
+    reply = last_ai_reply(messages)
+    if not reply:
+        return "start"
+    if ASK_STAND in reply or "移动推车，还是" in reply:
+        return "stand"
+    if ASK_SIZE in reply or "多大尺寸" in reply:
+        return "size"
+    if ASK_REMOTE in reply:
+        return "remote"
+    if "教学使用，还是会议" in reply:
+        return "scene"
+    return "other"
+
+
+class FastPathRouter:
+    """
+    脚本化流程的规则路由：能高置信识别的轮次（打招呼、回答场景、是否远程会议、回答尺寸）
+    直接按话术模板回复，不调用大模型；其余轮次返回 None，交给大模型处理。
+    识别出的信息同步写入 key_info 槽位。
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.turns = 0
+        self.bypassed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def route(self, user_input: str, history: List, key_info: Dict) -> Optional[str]:
+        reply, intent = None, None
+        if self.enabled:
+            reply, intent = self._match(normalize_query(user_input), history, key_info)
+        with self._lock:
+            self.turns += 1
+            if intent:
+                self.bypassed[intent] = self.bypassed.get(intent, 0) + 1
+        return reply
+
+    def _match(self, text: str, history: List, key_info: Dict):
+        if not text:
+            return None, None
+        stage = detect_stage(history)
+
+        if text in GREETINGS and stage in ("start", "scene") and not key_info.get("尺寸"):
+            return OPENING, "greeting"
+
+        if stage == "scene":
+            if MEETING_RE.match(text):
+                key_info["使用场景"] = "会议"
+                return ASK_REMOTE, "scene_meeting"
+            if TEACHING_RE.match(text):
+                key_info["使用场景"] = "教学"
+                return ASK_SIZE, "scene_teaching"
+
+        if stage == "remote":
+            if text in YES_WORDS:
+                key_info["远程会议"] = "经常"
+                return ASK_SIZE, "remote_answer"
+            if text in NO_WORDS:
+                key_info["远程会议"] = "不常"
+                return ASK_SIZE, "remote_answer"
+
+        if stage == "size" and not key_info.get("支架"):
+            m = SIZE_RE.match(text)
+            # 只接受尺寸表里有的尺寸；商品目录未加载时无法校验，交给大模型
+            snapshot = catalog_snapshot()
+            if m and snapshot is not None and snapshot.size(f"{m.group(2)}寸") is not None:
+                key_info["尺寸"] = f"{m.group(2)}寸"
+                return ASK_STAND, "size_answer"
+
+        return None, None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            bypassed = sum(self.bypassed.values())
+            return {
+                "enabled": self.enabled,
+                "turns": self.turns,
+                "bypassed": bypassed,
+                "bypass_rate": bypassed / self.turns if self.turns else 0.0,
+                "by_intent": dict(self.bypassed),
+            }
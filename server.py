@@ -0,0 +1,188 @@
+"""
+多会话 HTTP 服务：在一个 asyncio 事件循环里同时服务多个客户会话，
+所有会话共享同一个 AgentRuntime（LLM client、MCP 工具、缓存、检索引擎）。
+
+接口（JSON）：
+    GET    /health                     健康检查
+    GET    /stats                      运行时统计
+    GET    /sessions                   历史会话列表
+    POST   /sessions                   打开/创建会话 {"session_id": 可选}
+    POST   /sessions/<id>/messages     发送消息 {"content": "..."}，
+                                       以 NDJSON 分块流式返回 {"type": "token"|"final"|"error", ...}
+    DELETE /sessions/<id>              保存并关闭会话
+
+启动：python server.py；命令行客户端：AGENT_SERVER_URL=http://127.0.0.1:8765 python agent.py
+"""
+
+import asyncio
+import json
+import urllib.request
+from types import SimpleNamespace
+from http import HTTPStatus
+from agent import AgentRuntime
+from config import SERVER_HOST, SERVER_PORT
+from logger import logger
+
+
+class AgentServer:
+    def __init__(self, runtime: AgentRuntime, host: str = SERVER_HOST, port: int = SERVER_PORT):
+        self.runtime = runtime
+        self.host = host
+        self.port = port
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"智能体服务已启动: http://{self.host}:{self.port}")
+        return self
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").strip()
+            if not request_line:
+                return
+            method, path, _ = request_line.split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = value.strip()
+            length = int(headers.get("content-length") or 0)
+            body = await reader.readexactly(length) if length else b""
+            payload = json.loads(body.decode("utf-8")) if body else {}
+            await self._route(method.upper(), path.rstrip("/"), payload, writer)
+        except Exception as e:
+            logger.error(f"请求处理出错: {e}")
+            try:
+                self._send_json(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)})
+            except Exception:
+                pass
+        finally:
+            try:
+                await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _route(self, method, path, payload, writer):
+        parts = [p for p in path.split("/") if p]
+        if method == "GET" and parts == ["health"]:
+            return self._send_json(writer, HTTPStatus.OK, {"status": "ok"})
+        if method == "GET" and parts == ["stats"]:
+            return self._send_json(writer, HTTPStatus.OK, self.runtime.stats())
+        if parts[:1] == ["sessions"]:
+            if method == "GET" and len(parts) == 1:
+                return self._send_json(writer, HTTPStatus.OK, await self.runtime.list_sessions())
+            if method == "POST" and len(parts) == 1:
+                session = await self.runtime.open_session(payload.get("session_id"))
+                return self._send_json(writer, HTTPStatus.OK, {
+                    "session_id": session.session_id,
+                    "message_count": len(session.chat_history),
+                })
+            if method == "POST" and len(parts) == 3 and parts[2] == "messages":
+                return await self._stream_chat(writer, parts[1], payload.get("content", ""))
+            if method == "DELETE" and len(parts) == 2:
+                await self.runtime.close_session(parts[1])
+                return self._send_json(writer, HTTPStatus.OK, {"session_id": parts[1], "saved": True})
+        self._send_json(writer, HTTPStatus.NOT_FOUND, {"error": f"{method} {path} not found"})
+
+    def _send_json(self, writer, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+
+    async def _stream_chat(self, writer, session_id, content):
+        writer.write(
+            "HTTP/1.1 200 OK\r\n"
+            "Content-Type: application/x-ndjson; charset=utf-8\r\n"
+            "Transfer-Encoding: chunked\r\n"
+            "Connection: close\r\n\r\n".encode("latin-1")
+        )
+
+        def send_event(event):
+            data = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+            writer.write(f"{len(data):X}\r\n".encode("latin-1") + data + b"\r\n")
+
+        try:
+            answer = await self.runtime.chat(session_id, content, lambda token: send_event({"type": "token", "content": token}))
+            send_event({"type": "final", "content": answer})
+        except Exception as e:
+            logger.error(f"[{session_id}] 对话处理出错: {e}")
+            send_event({"type": "error", "error": str(e)})
+        writer.write(b"0\r\n\r\n")
+
+
+class RemoteAgentClient:
+    """agent.py 的远程模式：接口与 AgentRuntime 一致，通过 HTTP 调用 AgentServer。"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    def _request(self, method, path, payload=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else None
+        req = urllib.request.Request(
+            self.base_url + path,
+            data=data,
+            method=method,
+            headers={"Content-Type": "application/json"}
+        )
+        return urllib.request.urlopen(req)
+
+    def _json(self, method, path, payload=None):
+        with self._request(method, path, payload) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+
+    async def list_sessions(self):
+        return await asyncio.to_thread(self._json, "GET", "/sessions")
+
+    async def open_session(self, session_id=None):
+        data = await asyncio.to_thread(self._json, "POST", "/sessions", {"session_id": session_id})
+        return SimpleNamespace(**data)
+
+    async def close_session(self, session_id):
+        await asyncio.to_thread(self._json, "DELETE", f"/sessions/{session_id}")
+
+    async def chat(self, session_id, user_input, on_token=None):
+        def run():
+            answer = ""
+            with self._request("POST", f"/sessions/{session_id}/messages", {"content": user_input}) as resp:
+                for line in resp:
+                    if not line.strip():
+                        continue
+                    event = json.loads(line.decode("utf-8"))
+                    if event["type"] == "token" and on_token:
+                        on_token(event["content"])
+                    elif event["type"] == "final":
+                        answer = event["content"]
+                    elif event["type"] == "error":
+                        raise RuntimeError(event["error"])
+            return answer
+        return await asyncio.to_thread(run)
+
+
+async def main():
+    runtime = await AgentRuntime().start()
+    server = await AgentServer(runtime).start()
+    print(f"智能体服务运行中: http://{server.host}:{server.port} (Ctrl+C 退出)")
+    try:
+        await server.serve_forever()
+    finally:
+        await runtime.shutdown()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
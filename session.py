@@ -1,9 +1,11 @@
 import json
 import os
+import threading
 from datetime import datetime
 from typing import List, Dict, Any
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, SystemMessage, BaseMessage
-from config import BASE_DIR
+from config import BASE_DIR, SESSION_COMPACT_EVERY
+from logger import logger
 
 
 def get_session_dir():
@@ -46,32 +48,176 @@ def dict_to_message(message_dict):
         return HumanMessage(content=content)
 
 
-def save_session(session_id, messages, key_info=None):
-    session_dir = get_session_dir()
-    os.makedirs(session_dir, exist_ok=True)
-    
-    session_data = {
-        "session_id": session_id,
-        "created_at": datetime.now().isoformat(),
-        "messages": [message_to_dict(msg) for msg in messages],
-        "key_info": key_info or {}
-    }
-    file_path = get_session_path(session_id)
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(session_data, f, ensure_ascii=False, indent=2)
+class _JournalState:
+    """已写入日志的进度：消息条数、最后一条消息（用于校验历史没有被改写）、未压缩的记录数。"""
 
+    def __init__(self, created_at, persisted=0, last_message=None, records=0):
+        self.created_at = created_at
+        self.persisted = persisted
+        self.last_message = last_message
+        self.records = records
 
-def load_session(session_id):
+
+_journals: Dict[str, _JournalState] = {}
+_journals_lock = threading.Lock()
+
+
+def get_journal_path(session_id):
+    return os.path.join(get_session_dir(), f"{session_id}.jsonl")
+
+
+def _dumps(record):
+    return json.dumps(record, ensure_ascii=False, default=str) + "\n"
+
+
+def _state_record(messages, key_info, state):
+    return {"kind": "state", "message_count": len(messages), "key_info": key_info or {}, "state": state or {}}
+
+
+def _compact(session_id, journal, messages, key_info, state):
+    """整份重写：先写临时文件再 os.replace，写到一半崩溃也不会破坏已有日志。"""
+    path = get_journal_path(session_id)
+    tmp_path = f"{path}.tmp"
+    message_dicts = [message_to_dict(msg) for msg in messages]
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(_dumps({"kind": "header", "session_id": session_id, "created_at": journal.created_at}))
+        for message_dict in message_dicts:
+            f.write(_dumps({"kind": "message", "message": message_dict}))
+        f.write(_dumps(_state_record(messages, key_info, state)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    journal.persisted = len(messages)
+    journal.last_message = message_dicts[-1] if message_dicts else None
+    journal.records = 0
+    # 旧版整份 JSON 已迁移到日志
+    legacy_path = get_session_path(session_id)
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+
+
+def save_session(session_id, messages, key_info=None, state=None):
+    """
+    追加写：只把上次保存之后新增的消息和最新的槽位/状态追加到 sessions/<id>.jsonl，
+    写入量与会话长度无关；追加记录超过 SESSION_COMPACT_EVERY 条或历史被改写时整份压缩重写。
+    """
+    os.makedirs(get_session_dir(), exist_ok=True)
+    with _journals_lock:
+        journal = _journals.get(session_id)
+        if journal is None:
+            journal = _open_journal(session_id)
+            _journals[session_id] = journal
+
+        rewritten = journal.persisted > len(messages) or (
+            journal.persisted and message_to_dict(messages[journal.persisted - 1]) != journal.last_message
+        )
+        if rewritten or journal.records >= SESSION_COMPACT_EVERY or not os.path.exists(get_journal_path(session_id)):
+            _compact(session_id, journal, messages, key_info, state)
+            return
+
+        new_dicts = [message_to_dict(msg) for msg in messages[journal.persisted:]]
+        chunk = "".join(_dumps({"kind": "message", "message": d}) for d in new_dicts)
+        chunk += _dumps(_state_record(messages, key_info, state))
+        with open(get_journal_path(session_id), "a", encoding="utf-8") as f:
+            f.write(chunk)
+        journal.persisted = len(messages)
+        if new_dicts:
+            journal.last_message = new_dicts[-1]
+        journal.records += len(new_dicts) + 1
+
+
+def _open_journal(session_id) -> _JournalState:
+    """首次保存前确定 created_at：沿用已有日志或旧版 JSON 里的值，新会话取当前时间。"""
+    header = _read_header(get_journal_path(session_id))
+    if header is not None:
+        messages, _, _, records, complete = _replay(session_id)
+        if not complete:
+            # 末尾有写了一半的记录，不能在它后面继续追加，首次保存时整份重写
+            records = SESSION_COMPACT_EVERY
+        last_message = message_to_dict(messages[-1]) if messages else None
+        return _JournalState(header.get("created_at", ""), len(messages), last_message, records)
+    legacy = _load_legacy(session_id)
+    created_at = legacy.get("created_at") if legacy else None
+    # persisted=0 且日志文件不存在，首次保存会整份写入
+    return _JournalState(created_at or datetime.now().isoformat())
+
+
+def _read_header(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        first = f.readline()
+    try:
+        record = json.loads(first)
+    except ValueError:
+        return None
+    return record if record.get("kind") == "header" else None
+
+
+def _replay(session_id):
+    """
+    顺序回放日志，返回 (消息, key_info, state, 上次压缩后追加的记录数, 日志是否完整)。
+    崩溃时写了一半的末尾记录直接丢弃。
+    """
+    messages, key_info, state = [], {}, {}
+    records = 0
+    complete = True
+    with open(get_journal_path(session_id), "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning(f"会话日志 {session_id} 末尾记录不完整，已忽略")
+                complete = False
+                break
+            kind = record.get("kind")
+            if kind == "message":
+                messages.append(dict_to_message(record["message"]))
+            elif kind == "state":
+                key_info = record.get("key_info", {})
+                state = record.get("state", {})
+            records += 1
+    # 压缩后的日志是 header + 全部消息 + 一条状态，超出的部分都是之后追加的状态记录
+    return messages, key_info, state, max(records - len(messages) - 2, 0), complete
+
+
+def _load_legacy(session_id):
     file_path = get_session_path(session_id)
     if not os.path.exists(file_path):
-        return [], {}
-    
+        return None
     with open(file_path, "r", encoding="utf-8") as f:
-        session_data = json.load(f)
-    
+        return json.load(f)
+
+
+def load_session(session_id):
+    if os.path.exists(get_journal_path(session_id)):
+        messages, key_info, state, _, _ = _replay(session_id)
+        return messages, key_info, state
+
+    session_data = _load_legacy(session_id)
+    if session_data is None:
+        return [], {}, {}
     messages = [dict_to_message(msg) for msg in session_data.get("messages", [])]
     key_info = session_data.get("key_info", {})
-    return messages, key_info
+    state = session_data.get("state", {})
+    return messages, key_info, state
+
+
+def _journal_summary(path):
+    """只读首行（header）和文件尾部（最后一条状态记录），不回放整份日志。"""
+    header = _read_header(path) or {}
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        f.seek(max(size - 65536, 0))
+        tail = f.read().decode("utf-8", errors="ignore").splitlines()
+    for line in reversed(tail):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("kind") == "state":
+            return header.get("created_at", ""), record.get("message_count", 0)
+    return header.get("created_at", ""), 0
 
 
 def list_sessions():
@@ -79,20 +225,27 @@ def list_sessions():
     if not os.path.exists(session_dir):
         return []
     
-    sessions = []
+    sessions = {}
     for filename in os.listdir(session_dir):
-        if filename.endswith(".json"):
-            session_id = filename[:-5]
-            file_path = os.path.join(session_dir, filename)
-            try:
+        file_path = os.path.join(session_dir, filename)
+        try:
+            if filename.endswith(".jsonl"):
+                created_at, message_count = _journal_summary(file_path)
+                sessions[filename[:-6]] = {
+                    "session_id": filename[:-6],
+                    "created_at": created_at,
+                    "message_count": message_count
+                }
+            elif filename.endswith(".json") and filename[:-5] not in sessions:
                 with open(file_path, "r", encoding="utf-8") as f:
                     session_data = json.load(f)
-                sessions.append({
-                    "session_id": session_id,
+                sessions.setdefault(filename[:-5], {
+                    "session_id": filename[:-5],
                     "created_at": session_data.get("created_at", ""),
                     "message_count": len(session_data.get("messages", []))
                 })
-            except Exception:
-                pass
+        except Exception:
+            pass
+    sessions = list(sessions.values())
     sessions.sort(key=lambda x: x["created_at"], reverse=True)
     return sessions
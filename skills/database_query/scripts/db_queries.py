@@ -1,4 +1,32 @@
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Sequence
+from db import get_pool
+from catalog import catalog_snapshot
+
+
+class DatabaseQueryError(Exception):
+    """查询执行失败；sql 为可直接交给 MCP query 工具执行的完整语句。"""
+
+    def __init__(self, message: str, sql: str):
+        super().__init__(message)
+        self.sql = sql
+
+
+def render_sql(sql: str, params: Sequence = ()) -> str:
+    """把参数化 SQL 展开成字面 SQL（仅用于回退到 MCP query 工具和日志）。"""
+    quoted = tuple("'" + str(p).replace("\\", "\\\\").replace("'", "''") + "'" for p in params)
+    return sql % quoted if quoted else sql
+
+
+def run_query(sql: str, params: Sequence = ()) -> List[Dict[str, Any]]:
+    """通过连接池执行参数化 SQL，返回行字典列表。"""
+    try:
+        return get_pool().fetch_all(sql, params or None)
+    except Exception as e:
+        raise DatabaseQueryError(f"数据库查询失败: {e}", render_sql(sql, params)) from e
+
+
+def _first(rows: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    return rows[0] if rows else None
 
 
 def get_product_price(尺寸: str, 配置: str) -> Optional[Dict[str, Any]]:
@@ -13,8 +41,11 @@ def get_product_price(尺寸: str, 配置: str) -> Optional[Dict[str, Any]]:
         包含价格信息的字典，如果未找到返回 None
         示例: {"配置": "单系统/Win10/i5/8+256G", "尺寸": "55寸", "价格": 2350, "底价": 2290}
     """
-    sql = f"SELECT * FROM 商品报价表 WHERE 尺寸 = '{尺寸}' AND 配置 = '{配置}'"
-    return {"type": "sql_query", "sql": sql}
+    snapshot = catalog_snapshot()
+    if snapshot:
+        return snapshot.product_price(尺寸, 配置)
+    sql = "SELECT * FROM 商品报价表 WHERE 尺寸 = %s AND 配置 = %s"
+    return _first(run_query(sql, (尺寸, 配置)))
 
 
 def get_product_by_size(尺寸: str) -> List[Dict[str, Any]]:
@@ -27,8 +58,25 @@ def get_product_by_size(尺寸: str) -> List[Dict[str, Any]]:
     Returns:
         商品配置列表
     """
-    sql = f"SELECT * FROM 商品报价表 WHERE 尺寸 = '{尺寸}'"
-    return {"type": "sql_query", "sql": sql}
+    snapshot = catalog_snapshot()
+    if snapshot:
+        return snapshot.products(尺寸)
+    sql = "SELECT * FROM 商品报价表 WHERE 尺寸 = %s"
+    return run_query(sql, (尺寸,))
+
+
+def get_all_products() -> List[Dict[str, Any]]:
+    """
+    查询商品报价表全部商品（用于批量报价矩阵）
+    
+    Returns:
+        商品列表
+    """
+    snapshot = catalog_snapshot()
+    if snapshot:
+        return [dict(r) for r in snapshot.tables.get("商品报价表", [])]
+    sql = "SELECT * FROM 商品报价表"
+    return run_query(sql)
 
 
 def get_available_configs(尺寸: str) -> List[str]:
@@ -41,8 +89,28 @@ def get_available_configs(尺寸: str) -> List[str]:
     Returns:
         配置列表
     """
-    sql = f"SELECT DISTINCT 配置 FROM 商品报价表 WHERE 尺寸 = '{尺寸}'"
-    return {"type": "sql_query", "sql": sql}
+    snapshot = catalog_snapshot()
+    if snapshot:
+        return snapshot.configs(尺寸)
+    sql = "SELECT DISTINCT 配置 FROM 商品报价表 WHERE 尺寸 = %s"
+    return [row["配置"] for row in run_query(sql, (尺寸,))]
+
+
+def get_i5_i7_price_rows(尺寸: str) -> List[Dict[str, Any]]:
+    """
+    查询同一尺寸下 i5 与 i7 相关配置的价格行，用于对比 i5 与 i7 价格差
+    
+    Args:
+        尺寸: 商品尺寸，如 "55寸"
+    
+    Returns:
+        价格行列表（配置, 尺寸, 价格, 底价）
+    """
+    snapshot = catalog_snapshot()
+    if snapshot:
+        return snapshot.i5_i7_price_rows(尺寸)
+    sql = "SELECT 配置, 尺寸, 价格, 底价 FROM 商品报价表 WHERE 尺寸 = %s AND (配置 LIKE %s OR 配置 LIKE %s)"
+    return run_query(sql, (尺寸, "%i5%", "%i7%"))
 
 
 def get_size_info(尺寸: str) -> Optional[Dict[str, str]]:
@@ -56,8 +124,11 @@ def get_size_info(尺寸: str) -> Optional[Dict[str, str]]:
         包含尺寸信息的字典，如果未找到返回 None
         示例: {"尺寸": "55寸", "长宽厚": "1270.1*768.4*96.2mm"}
     """
-    sql = f"SELECT * FROM 尺寸表 WHERE 尺寸 = '{尺寸}'"
-    return {"type": "sql_query", "sql": sql}
+    snapshot = catalog_snapshot()
+    if snapshot:
+        return snapshot.size(尺寸)
+    sql = "SELECT * FROM 尺寸表 WHERE 尺寸 = %s"
+    return _first(run_query(sql, (尺寸,)))
 
 
 def get_all_sizes() -> List[Dict[str, str]]:
@@ -67,8 +138,11 @@ def get_all_sizes() -> List[Dict[str, str]]:
     Returns:
         尺寸列表
     """
+    snapshot = catalog_snapshot()
+    if snapshot:
+        return snapshot.sizes()
     sql = "SELECT * FROM 尺寸表"
-    return {"type": "sql_query", "sql": sql}
+    return run_query(sql)
 
 
 def get_memory_upgrade(配置: str) -> List[Dict[str, Any]]:
@@ -81,8 +155,11 @@ def get_memory_upgrade(配置: str) -> List[Dict[str, Any]]:
     Returns:
         升级方案列表
     """
-    sql = f"SELECT * FROM 内存硬盘升级报价表 WHERE 配置 = '{配置}'"
-    return {"type": "sql_query", "sql": sql}
+    snapshot = catalog_snapshot()
+    if snapshot:
+        return snapshot.memory_upgrade(配置)
+    sql = "SELECT * FROM 内存硬盘升级报价表 WHERE 配置 = %s"
+    return run_query(sql, (配置,))
 
 
 def get_processor_upgrade(机型: str) -> List[Dict[str, Any]]:
@@ -95,8 +172,11 @@ def get_processor_upgrade(机型: str) -> List[Dict[str, Any]]:
     Returns:
         升级方案列表
     """
-    sql = f"SELECT * FROM 处理器升级报价表 WHERE 机型 = '{机型}'"
-    return {"type": "sql_query", "sql": sql}
+    snapshot = catalog_snapshot()
+    if snapshot:
+        return snapshot.processor_upgrade(机型)
+    sql = "SELECT * FROM 处理器升级报价表 WHERE 机型 = %s"
+    return run_query(sql, (机型,))
 
 
 def get_anti_glare_upgrade(尺寸: str) -> List[Dict[str, Any]]:
@@ -109,8 +189,11 @@ def get_anti_glare_upgrade(尺寸: str) -> List[Dict[str, Any]]:
     Returns:
         升级方案列表
     """
-    sql = f"SELECT * FROM 防眩光升级报价表 WHERE 尺寸 = '{尺寸}'"
-    return {"type": "sql_query", "sql": sql}
+    snapshot = catalog_snapshot()
+    if snapshot:
+        return snapshot.anti_glare_upgrade(尺寸)
+    sql = "SELECT * FROM 防眩光升级报价表 WHERE 尺寸 = %s"
+    return run_query(sql, (尺寸,))
 
 
 def get_gifts() -> List[str]:
@@ -120,8 +203,11 @@ def get_gifts() -> List[str]:
     Returns:
         赠品列表
     """
+    snapshot = catalog_snapshot()
+    if snapshot:
+        return list(snapshot.gifts)
     sql = "SELECT 赠品 FROM 赠品表 ORDER BY 序列"
-    return {"type": "sql_query", "sql": sql}
+    return [row["赠品"] for row in run_query(sql)]
 
 
 def search_script(script_type: str, query: str) -> Dict[str, Any]:
@@ -146,7 +232,7 @@ def search_script(script_type: str, query: str) -> Dict[str, Any]:
         return {"error": f"未知的话术类型: {script_type}"}
     
     sql = f"SELECT * FROM {table_name}"
-    return {"type": "sql_query", "sql": sql}
+    return {"table": table_name, "rows": run_query(sql)}
 
 
 def calculate_final_price(
@@ -0,0 +1,140 @@
+"""
+报价引擎：基于 calculate_final_price 的定价规则（壁挂 -100、普票 ×1.03、专票 ×1.10），
+一次算出完整报价（基础价、升级、支架、税费、多台合计、底价校验）；
+批量模式一次算出 尺寸 × 配置 × 支架 × 开票 的完整价格矩阵，用于导出价目表和回归校验。
+
+导出价目表：python -m skills.database_query.scripts.quote_engine price_matrix.csv
+"""
+
+import csv
+import sys
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from .db_queries import calculate_final_price, get_product_price, get_size_info, get_all_products
+
+
+STAND_TYPES = ["移动推车", "壁挂"]
+INVOICE_TYPES = [None, "普票", "专票"]
+STAND_ADJUSTMENT = {"移动推车": 0, "壁挂": -100}
+TAX_RATE = {None: 1.0, "普票": 1.03, "专票": 1.10}
+
+
+def normalize_invoice(开票类型: Optional[str]) -> Optional[str]:
+    """把 "不含税"/"开普票"/"增值税专用发票" 等说法归一成 None/"普票"/"专票"。"""
+    if not 开票类型:
+        return None
+    if "专" in 开票类型:
+        return "专票"
+    if "普" in 开票类型:
+        return "普票"
+    return None
+
+
+def tax_label(开票类型: Optional[str]) -> str:
+    return f"含税（{开票类型}）" if 开票类型 else "不含税"
+
+
+def build_quote(
+    尺寸: str,
+    配置: str,
+    支架类型: str = "移动推车",
+    开票类型: Optional[str] = None,
+    台数: int = 1,
+    升级差价: float = 0,
+    客户要求价格: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    计算一份完整报价。客户要求价格为单价；底价只用于校验和主管申请，不能透露给用户。
+    """
+    product = get_product_price(尺寸, 配置)
+    if not product:
+        return {"error": f"商品报价表中没有 {尺寸} {配置}"}
+    开票类型 = normalize_invoice(开票类型)
+    台数 = max(int(台数 or 1), 1)
+
+    unit = calculate_final_price(product["价格"], 升级差价, 支架类型, 开票类型)
+    floor = calculate_final_price(product["底价"], 升级差价, 支架类型, 开票类型)
+    size_info = get_size_info(尺寸) or {}
+
+    quote = {
+        "尺寸": f"{尺寸} {size_info['长宽厚']}" if size_info.get("长宽厚") else 尺寸,
+        "配置": product["配置"],
+        "支架": 支架类型,
+        "台数": 台数,
+        "是否含税": tax_label(开票类型),
+        "基础价格": unit["基础价格"],
+        "升级差价": unit["升级差价"],
+        "支架调整": unit["支架调整"],
+        "税费": round(unit["税费"], 2),
+        "单价": unit["最终价格"],
+        "总价": round(unit["最终价格"] * 台数, 2),
+        "底价单价(内部)": floor["最终价格"],
+    }
+    if 客户要求价格 is not None:
+        quote["客户要求价格"] = 客户要求价格
+        quote["低于底价"] = 客户要求价格 < floor["最终价格"]
+    return quote
+
+
+def price_matrix(
+    products: Optional[List[Dict[str, Any]]] = None,
+    stands: Sequence[str] = STAND_TYPES,
+    invoices: Sequence[Optional[str]] = INVOICE_TYPES,
+) -> List[Dict[str, Any]]:
+    """
+    批量模式：对所有商品一次性广播计算 商品 × 支架 × 开票 的最终价格，
+    运算顺序与 calculate_final_price 一致（先加升级/支架调整，再乘税率）。
+    """
+    products = get_all_products() if products is None else products
+    if not products:
+        return []
+    base = np.array([float(p["价格"]) for p in products])
+    stand_adj = np.array([STAND_ADJUSTMENT.get(s, 0) for s in stands], dtype=float)
+    tax = np.array([TAX_RATE[normalize_invoice(i)] for i in invoices])
+    totals = (base[:, None, None] + stand_adj[None, :, None]) * tax[None, None, :]
+
+    rows = []
+    for i, product in enumerate(products):
+        for j, stand in enumerate(stands):
+            for k, invoice in enumerate(invoices):
+                rows.append({
+                    "尺寸": product["尺寸"],
+                    "配置": product["配置"],
+                    "支架": stand,
+                    "是否含税": tax_label(normalize_invoice(invoice)),
+                    "开票类型": normalize_invoice(invoice),
+                    "基础价格": product["价格"],
+                    "最终价格": round(float(totals[i, j, k]), 2),
+                })
+    return rows
+
+
+def check_price_matrix(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """回归校验：逐格用 calculate_final_price 复算，返回不一致的行。"""
+    mismatches = []
+    for row in rows:
+        expected = calculate_final_price(row["基础价格"], 0, row["支架"], row["开票类型"])["最终价格"]
+        if abs(expected - row["最终价格"]) > 0.005:
+            mismatches.append({**row, "期望价格": expected})
+    return mismatches
+
+
+def export_price_matrix(path: str, rows: Optional[List[Dict[str, Any]]] = None) -> int:
+    rows = price_matrix() if rows is None else rows
+    fields = ["尺寸", "配置", "支架", "是否含税", "基础价格", "最终价格"]
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    return len(rows)
+
+
+if __name__ == "__main__":
+    out_path = sys.argv[1] if len(sys.argv) > 1 else "price_matrix.csv"
+    matrix = price_matrix()
+    bad = check_price_matrix(matrix)
+    count = export_price_matrix(out_path, matrix)
+    print(f"已导出 {count} 行价目表到 {out_path}，校验不一致 {len(bad)} 行")
+    for row in bad:
+        print(row)
+    sys.exit(1 if bad else 0)
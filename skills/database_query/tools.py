@@ -1,38 +1,65 @@
 from langchain_core.tools import tool
+from typing import Optional
 from .scripts import db_queries as dq
+from .scripts import quote_engine as qe
+
+
+def _execute(query_fn, *args):
+    """
+    直接执行查询并返回结果行；数据库不可用时退回旧协议，
+    返回 {"type": "sql_query", "sql": ...} 让模型改用 MCP query 工具执行。
+    """
+    try:
+        return query_fn(*args)
+    except dq.DatabaseQueryError as e:
+        return {"type": "sql_query", "sql": e.sql, "error": str(e)}
 
 
 @tool
-def dbq_price_by_size_config(尺寸: str, 配置: str) -> dict:
+def dbq_price_by_size_config(尺寸: str, 配置: str):
     """
-    查询指定尺寸与配置的商品价格。用于直接获取某个尺寸+配置的一行报价数据。
+    查询指定尺寸与配置的商品价格。直接返回一行报价数据（配置, 尺寸, 价格, 底价），未找到时返回 None。
     """
-    r = dq.get_product_price(尺寸, 配置)
-    return r
+    return _execute(dq.get_product_price, 尺寸, 配置)
 
 
 @tool
-def dbq_configs_by_size(尺寸: str) -> dict:
+def dbq_configs_by_size(尺寸: str):
     """
-    查询给定尺寸下的可用配置列表。用于快速获取该尺寸下所有配置选项。
+    查询给定尺寸下的可用配置列表。直接返回该尺寸下所有配置名称。
     """
-    r = dq.get_available_configs(尺寸)
-    return r
+    return _execute(dq.get_available_configs, 尺寸)
 
 
 @tool
-def dbq_i5_i7_price_rows(尺寸: str) -> dict:
+def dbq_i5_i7_price_rows(尺寸: str):
     """
     一次性查询同一尺寸下 i5 与 i7 相关配置的价格行。用于对比 i5 与 i7 价格差。
     """
-    sql = f"SELECT 配置, 尺寸, 价格, 底价 FROM 商品报价表 WHERE 尺寸 = '{尺寸}' AND (配置 LIKE '%i5%' OR 配置 LIKE '%i7%')"
-    return {"type": "sql_query", "sql": sql}
+    return _execute(dq.get_i5_i7_price_rows, 尺寸)
+
+
+@tool
+def dbq_size_info(尺寸: str):
+    """
+    查询指定尺寸的长宽厚等尺寸信息。直接返回 {"尺寸", "长宽厚"}，用于生成报价单中的尺寸字段。
+    """
+    return _execute(dq.get_size_info, 尺寸)
 
 
 @tool
-def dbq_size_info(尺寸: str) -> dict:
+def dbq_quote(
+    尺寸: str,
+    配置: str,
+    支架类型: str = "移动推车",
+    开票类型: Optional[str] = None,
+    台数: int = 1,
+    升级差价: float = 0,
+    客户要求价格: Optional[float] = None,
+):
     """
-    查询指定尺寸的长宽厚等尺寸信息。用于生成报价单中的尺寸字段。
+    一次算出完整报价：基础价格、升级差价、支架调整（壁挂 -100）、税费（普票 ×1.03、专票 ×1.10）、单价和多台总价。
+    支架类型: "移动推车" 或 "壁挂"；开票类型: 不开票留空，或 "普票"/"专票"；升级差价为各升级报价表查到的差价之和。
+    传入客户要求价格（单价）时会返回是否低于底价。结果中的底价仅供内部判断和主管申请，绝对不能告诉用户。
     """
-    r = dq.get_size_info(尺寸)
-    return r
+    return _execute(qe.build_quote, 尺寸, 配置, 支架类型, 开票类型, 台数, 升级差价, 客户要求价格)
@@ -0,0 +1,60 @@
+import re
+from typing import Dict, List, Optional
+from langchain_core.messages import AIMessage
+
+
+# 槽位名 -> 报价单中的字段名（见 system_prompt.txt 的汇总格式）
+SLOT_FIELDS = {
+    "尺寸": "尺寸",
+    "配置": "配置",
+    "支架": "支架",
+    "台数": "台数",
+    "赠品": "赠品",
+    "价格": "价格",
+    "开票": "是否含税",
+}
+SLOT_PATTERNS = {
+    slot: re.compile(rf"^[\s*\-]*{field}(?:\*\*)?\s*[：:]\s*(?:\*\*)?\s*(.+?)\s*$", re.MULTILINE)
+    for slot, field in SLOT_FIELDS.items()
+}
+PLACEHOLDER_RE = re.compile(r"^(\{.*\}|\.{2,}|…+|-+|无|待定|暂无)$")
+
+
+def extract_slots(content: str) -> Dict[str, str]:
+    """从一条客服回复里提取报价单字段，只认行首的 “字段：值” 格式，忽略模板占位符。"""
+    slots = {}
+    for slot, pattern in SLOT_PATTERNS.items():
+        for match in pattern.finditer(content or ""):
+            value = match.group(1).strip().strip("*").strip()
+            if value and not PLACEHOLDER_RE.match(value):
+                slots[slot] = value
+    return slots
+
+
+class SlotTracker:
+    """
+    增量槽位跟踪：只处理 checkpoint 之后新增的消息，每轮提取成本与对话长度无关。
+    slots 与会话的 key_info 是同一个 dict，checkpoint 随会话一起保存。
+    """
+
+    def __init__(self, slots: Optional[Dict[str, str]] = None, checkpoint: int = 0):
+        self.slots = slots if slots is not None else {}
+        self.checkpoint = checkpoint
+
+    def update(self, messages: List) -> Dict[str, str]:
+        """处理新消息，返回本次有变化的槽位。"""
+        if self.checkpoint > len(messages):
+            # 历史被截断或替换，从头重新提取
+            self.checkpoint = 0
+        changed = {}
+        for msg in messages[self.checkpoint:]:
+            if isinstance(msg, AIMessage) and not getattr(msg, "tool_calls", None) and isinstance(msg.content, str):
+                for slot, value in extract_slots(msg.content).items():
+                    if self.slots.get(slot) != value:
+                        changed[slot] = value
+                self.slots.update(changed)
+        self.checkpoint = len(messages)
+        return changed
+
+    def state(self) -> Dict[str, int]:
+        return {"slot_checkpoint": self.checkpoint}
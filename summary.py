@@ -0,0 +1,51 @@
+from typing import List
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+
+SUMMARY_PROMPT = """你是对话记录员。请把【已有摘要】和【新增对话】合并成一份新的摘要，供客服继续接待同一位客户时参考。
+要求：
+- 保留客户需求（使用场景、尺寸、配置、支架、台数、赠品、开票）、每次报价与议价过程、主管批复结果、已经做出的承诺。
+- 删除寒暄、重复内容和查询过程。
+- 不超过{max_chars}字，只输出摘要正文。"""
+
+# 单条消息写进摘要素材时的最大长度，避免大段 SQL 结果占满摘要请求
+MAX_MESSAGE_CHARS = 300
+
+
+def format_transcript(messages: List[BaseMessage]) -> str:
+    lines = []
+    for msg in messages:
+        content = msg.content if isinstance(msg.content, str) else str(msg.content)
+        if isinstance(msg, HumanMessage):
+            role = "客户"
+        elif isinstance(msg, AIMessage):
+            if msg.tool_calls:
+                calls = ", ".join(f"{tc['name']}({tc.get('args', {})})" for tc in msg.tool_calls)
+                content = f"{content}\n调用工具: {calls}" if content else f"调用工具: {calls}"
+            role = "客服"
+        elif isinstance(msg, ToolMessage):
+            role = "工具结果"
+        else:
+            continue
+        content = content.strip()
+        if len(content) > MAX_MESSAGE_CHARS:
+            content = content[:MAX_MESSAGE_CHARS] + "..."
+        if content:
+            lines.append(f"{role}: {content}")
+    return "\n".join(lines)
+
+
+async def summarize(llm, previous_summary: str, messages: List[BaseMessage], max_chars: int) -> str:
+    """把移出上下文窗口的消息并入滚动摘要。"""
+    request = [
+        SystemMessage(content=SUMMARY_PROMPT.format(max_chars=max_chars)),
+        HumanMessage(content=f"【已有摘要】\n{previous_summary or '（无）'}\n\n【新增对话】\n{format_transcript(messages)}"),
+    ]
+    response = await llm.ainvoke(request)
+    summary = (response.content or "").strip()
+    # 模型偶尔超长，硬截断保证 prompt 大小有上界
+    return summary[:max_chars]
+
+
+def format_summary_block(summary: str) -> str:
+    return f"【早前对话摘要】\n{summary}\n\n" if summary else ""
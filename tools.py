@@ -1,80 +1,107 @@
-import chromadb
-from chromadb.utils import embedding_functions
-import dashscope
-from dashscope import TextEmbedding
-from http import HTTPStatus
 from langchain_core.tools import tool
-from typing import List
-import os
+import threading
+from retrieval import get_engine
+from cache import SemanticResultCache, normalize_query
+from lexical_index import reciprocal_rank_fusion
+from media_index import query_modalities
 from config import (
-    BASE_DIR,
-    CHROMA_PATH,
-    EMBEDDING_MODEL_NAME,
-    EMBEDDING_DIMENSION,
-    DASHSCOPE_API_KEY
+    RESULT_CACHE_CAPACITY,
+    RESULT_CACHE_MAX_DISTANCE,
+    HYBRID_CANDIDATES,
+    LEXICAL_CONFIDENT_MARGIN,
+    LEXICAL_MIN_QUERY_TERMS,
+    LEXICAL_MIN_DOC_COVERAGE
 )
 
 
-class AliyunEmbeddingFunction(embedding_functions.EmbeddingFunction):
-    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, 
-                 dimension: int = EMBEDDING_DIMENSION,
-                 api_key: str = DASHSCOPE_API_KEY):
-        self.model_name = model_name
-        self.dimension = dimension
-        self.api_key = api_key
-        if self.api_key:
-            dashscope.api_key = self.api_key
-        else:
-            raise ValueError("DASHSCOPE_API_KEY is required. Please set it in .env file.")
-    
-    def __call__(self, input: List[str]) -> List[List[float]]:
-        all_embeddings = []
-        
-        for text in input:
-            resp = TextEmbedding.call(
-                model=self.model_name,
-                input=text,
-                dimension=self.dimension
-            )
-            
-            if resp.status_code == HTTPStatus.OK:
-                embedding = resp.output['embeddings'][0]['embedding']
-                all_embeddings.append(embedding)
-            else:
-                raise RuntimeError(f"Embedding request failed: {resp}")
-        
-        return all_embeddings
+# 跨会话共享的知识库检索结果缓存
+qa_result_cache = SemanticResultCache(RESULT_CACHE_CAPACITY, RESULT_CACHE_MAX_DISTANCE)
+
+# 多个会话并发时，主管审批在同一个终端上逐个进行
+_approval_lock = threading.Lock()
+
+# 媒体集合 -> 模态
+MEDIA_COLLECTIONS = {"kb_image": "image", "kb_video": "video"}
+
+
+def _answer_payload(doc: str, meta: dict):
+    """返回 (去重键, 答案)。旧版索引没有 answer 字段时退回整段文本。"""
+    meta = meta or {}
+    answer = meta.get("answer") or doc
+    return meta.get("qa_id") or answer, answer
+
+
+def _format_knowledge(payloads, limit: int = 3) -> str:
+    answers = []
+    seen = set()
+    for qa_id, answer in payloads:
+        if qa_id in seen:
+            continue
+        seen.add(qa_id)
+        answers.append(answer)
+        if len(answers) >= limit:
+            break
+    return "\n\n".join(f"{i}. {answer}" for i, answer in enumerate(answers, 1))
 
 
 @tool
 def search_local_knowledge(query: str) -> str:
     """
-    Search for answers in local knowledge base (RAG) using semantic search.
+    Search for answers in local knowledge base (RAG) using keyword + semantic search.
     Useful for answering general questions about product features, common issues, and opening requirements.
+    Returns up to 3 numbered answers matched against the stored customer questions.
     
     Args:
         query: The search query string.
     """
     try:
-        os.makedirs(CHROMA_PATH, exist_ok=True)
-        client = chromadb.PersistentClient(path=CHROMA_PATH)
-        embedding_fn = AliyunEmbeddingFunction()
-        collection = client.get_or_create_collection(
-            name="qa_knowledge_base",
-            embedding_function=embedding_fn
-        )
-        if collection.count() == 0:
+        engine = get_engine()
+        qa_result_cache.sync_version(engine.collection_version("qa_knowledge_base"))
+        cache_key = normalize_query(query)
+        cached = qa_result_cache.get_exact(cache_key)
+        if cached is not None:
+            return cached
+
+        # 1. 词法检索：关键词完全命中且明显领先时直接返回，不发起 embedding 请求
+        lexical = engine.lexical_index("qa_knowledge_base")
+        lexical_hits = lexical.search(query, HYBRID_CANDIDATES) if lexical else []
+        if lexical and lexical.is_confident(
+            query, lexical_hits, LEXICAL_CONFIDENT_MARGIN, LEXICAL_MIN_QUERY_TERMS, LEXICAL_MIN_DOC_COVERAGE
+        ):
+            context_str = _format_knowledge(
+                [_answer_payload(lexical.documents[i], lexical.metadatas[i]) for i, _ in lexical_hits]
+            )
+            qa_result_cache.put(cache_key, None, context_str)
+            return context_str
+
+        if engine.count("qa_knowledge_base") == 0:
             return "知识库为空，请先构建：运行 python build_rag.py"
-        results = collection.query(
-            query_texts=[query],
-            n_results=3
+        query_embedding = engine.embed([query])[0]
+        cached = qa_result_cache.get_similar(query_embedding)
+        if cached is not None:
+            return cached
+
+        # 2. 向量检索，并与词法结果做倒数排名融合
+        results = engine.query(
+            "qa_knowledge_base",
+            query_embeddings=[query_embedding],
+            n_results=HYBRID_CANDIDATES
         )
-        if not results['documents'] or not results['documents'][0]:
+        by_id = {}
+        vector_ranking = []
+        for doc_id, doc, meta in zip(results.get("ids", [[]])[0], results["documents"][0], results["metadatas"][0]):
+            by_id[doc_id] = _answer_payload(doc, meta)
+            vector_ranking.append(doc_id)
+        lexical_ranking = []
+        for i, _ in lexical_hits:
+            doc_id = lexical.ids[i]
+            by_id.setdefault(doc_id, _answer_payload(lexical.documents[i], lexical.metadatas[i]))
+            lexical_ranking.append(doc_id)
+        fused = reciprocal_rank_fusion([vector_ranking, lexical_ranking])
+        if not fused:
             return "未在知识库中找到相关信息。"
-        context_str = ""
-        for i, doc in enumerate(results['documents'][0]):
-            source = results['metadatas'][0][i]['source']
-            context_str += f"--- Source: {source} ---\n{doc}\n\n"
+        context_str = _format_knowledge([by_id[doc_id] for doc_id in fused])
+        qa_result_cache.put(cache_key, query_embedding, context_str)
         return context_str
     except Exception as e:
         hint = ""
@@ -83,53 +110,64 @@ def search_local_knowledge(query: str) -> str:
         return f"Error searching knowledge base: {str(e)}{hint}"
 
 @tool
-def search_media_asset(query: str) -> str:
+def search_media_asset(query: str, top_k: int = 3) -> str:
     """
-    Search for a related local media asset (image/video) by text query.
-    Returns best matched modality and absolute file path for sending to user.
+    Search for related local media assets (image/video) by text query.
+    Returns up to top_k matches ranked across modalities (best first),
+    each with modality and absolute file path for sending to user.
     """
     try:
-        os.makedirs(CHROMA_PATH, exist_ok=True)
-        client = chromadb.PersistentClient(path=CHROMA_PATH)
-        embedding_fn = AliyunEmbeddingFunction()
+        engine = get_engine()
+
+        # 标签命中时直接返回，不发起 embedding 请求
+        tag_index = engine.tag_index()
+        tag_hits = tag_index.match(query, top_k) if tag_index else []
+        if tag_hits:
+            return "\n\n".join(
+                f"rank={i}\nmodality={a.get('modality', '')}\npath={a.get('path', '')}\ntitle={a.get('title', '')}\nmatched_tags={'，'.join(a['matched_tags'])}"
+                for i, a in enumerate(tag_hits, 1)
+            )
 
-        img_col = client.get_or_create_collection(name="kb_image", embedding_function=embedding_fn)
-        vid_col = client.get_or_create_collection(name="kb_video", embedding_function=embedding_fn)
+        # 构建脚本更新过媒体集合时丢弃旧句柄（mmap 后端否则会一直用旧的向量和记录）
+        for name in MEDIA_COLLECTIONS:
+            engine.collection_version(name)
+        names = [name for name in MEDIA_COLLECTIONS if engine.count(name) > 0]
 
-        if img_col.count() == 0 and vid_col.count() == 0:
+        if not names:
             return "媒体库为空，请先构建：运行 python build_multimodal_kb.py"
+        # 查询里说了要图片或视频时，只检索对应模态的集合
+        modalities = query_modalities(query)
+        if modalities:
+            names = [name for name in names if MEDIA_COLLECTIONS[name] in modalities]
+            if not names:
+                return "未在媒体库中找到相关文件。"
 
-        candidates = []
-
-        if img_col.count() > 0:
-            r = img_col.query(query_texts=[query], n_results=1, include=["metadatas", "distances", "documents"])
-            if r.get("metadatas") and r["metadatas"][0]:
-                candidates.append(
-                    {
-                        "modality": "image",
-                        "path": r["metadatas"][0][0].get("path", ""),
-                        "score": float(r.get("distances", [[0.0]])[0][0]),
-                        "title": r["metadatas"][0][0].get("title", ""),
-                    }
-                )
+        # 查询只向量化一次，所有模态集合并行检索
+        query_embedding = engine.embed([query])[0]
+        results = engine.query_many(names, [query_embedding], top_k, include=["metadatas", "distances"])
 
-        if vid_col.count() > 0:
-            r = vid_col.query(query_texts=[query], n_results=1, include=["metadatas", "distances", "documents"])
-            if r.get("metadatas") and r["metadatas"][0]:
+        candidates = []
+        for name, r in results.items():
+            metadatas = (r.get("metadatas") or [[]])[0]
+            distances = (r.get("distances") or [[]])[0]
+            for meta, distance in zip(metadatas, distances):
                 candidates.append(
                     {
-                        "modality": "video",
-                        "path": r["metadatas"][0][0].get("path", ""),
-                        "score": float(r.get("distances", [[0.0]])[0][0]),
-                        "title": r["metadatas"][0][0].get("title", ""),
+                        "modality": MEDIA_COLLECTIONS[name],
+                        "path": meta.get("path", ""),
+                        "score": float(distance),
+                        "title": meta.get("title", ""),
                     }
                 )
 
         if not candidates:
             return "未在媒体库中找到相关文件。"
 
-        best = sorted(candidates, key=lambda x: x["score"])[0]
-        return f"modality={best['modality']}\npath={best['path']}\ntitle={best['title']}\ndistance={best['score']}"
+        ranked = sorted(candidates, key=lambda x: x["score"])[:top_k]
+        return "\n\n".join(
+            f"rank={i}\nmodality={c['modality']}\npath={c['path']}\ntitle={c['title']}\ndistance={c['score']}"
+            for i, c in enumerate(ranked, 1)
+        )
     except Exception as e:
         hint = ""
         if "Embedding model load failed" in str(e) or "Server disconnected" in str(e):
@@ -146,12 +184,13 @@ def ask_supervisor_approval(application_details: str) -> str:
     Args:
         application_details: A formatted string containing the application details (Size, Config, Price, etc.).
     """
-    print("\n" + "="*50)
-    print("📢 【向主管申请价格】")
-    print(application_details)
-    print("="*50 + "\n")
-    
-    approval = input("主管请批复 (同意/拒绝/其他指令): ")
+    with _approval_lock:
+        print("\n" + "="*50)
+        print("📢 【向主管申请价格】")
+        print(application_details)
+        print("="*50 + "\n")
+        
+        approval = input("主管请批复 (同意/拒绝/其他指令): ")
     return f"主管批复: {approval}"
 
 
@@ -163,11 +202,12 @@ def ask_installation_approval(installation_details: str) -> str:
     Args:
         installation_details: 格式化后的申请详情文本。
     """
-    print("\n" + "="*50)
-    print("📢 【向主管申请包安装】")
-    print(installation_details)
-    print("="*50 + "\n")
-    approval = input("主管请批复 (同意/拒绝/其他指令): ")
+    with _approval_lock:
+        print("\n" + "="*50)
+        print("📢 【向主管申请包安装】")
+        print(installation_details)
+        print("="*50 + "\n")
+        approval = input("主管请批复 (同意/拒绝/其他指令): ")
     return f"主管批复: {approval}"
 
 
@@ -0,0 +1,211 @@
+import json
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+from config import CHROMA_PATH, VECTOR_STORE_DIR, VECTOR_BACKEND, EMBEDDING_DIMENSION
+
+
+DEFAULT_INCLUDE = ["metadatas", "documents", "distances"]
+
+
+class VectorStore(ABC):
+    """
+    向量存储接口。query 返回与 Chroma 相同结构的结果：
+    {"ids": [[...]], "documents": [[...]], "metadatas": [[...]], "distances": [[...]]}
+    """
+
+    name: str
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def ids(self) -> List[str]:
+        ...
+
+    @abstractmethod
+    def upsert(self, ids: List[str], documents: List[str], metadatas: List[Dict],
+               embeddings: Optional[List[List[float]]] = None) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, ids: List[str]) -> None:
+        ...
+
+    @abstractmethod
+    def query(self, query_embeddings: List[List[float]], n_results: int,
+              include: Optional[List[str]] = None) -> Dict[str, Any]:
+        ...
+
+
+class ChromaVectorStore(VectorStore):
+    def __init__(self, client, name: str, embedding_fn: Callable):
+        self.name = name
+        self.collection = client.get_or_create_collection(name=name, embedding_function=embedding_fn)
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def ids(self) -> List[str]:
+        return self.collection.get(include=[])["ids"]
+
+    def upsert(self, ids, documents, metadatas, embeddings=None) -> None:
+        self.collection.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+
+    def delete(self, ids) -> None:
+        self.collection.delete(ids=ids)
+
+    def query(self, query_embeddings, n_results, include=None):
+        return self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            include=include or DEFAULT_INCLUDE
+        )
+
+
+class MmapVectorStore(VectorStore):
+    """
+    进程内向量索引：归一化后的 float32 矩阵以内存映射文件保存，
+    检索时对整张矩阵做一次矩阵乘法取 top-k，距离为余弦距离 (1 - cos)。
+    适合本项目这种几百条以内的小语料。
+    """
+
+    def __init__(self, root_dir: str, name: str, embedding_fn: Optional[Callable] = None,
+                 dimension: int = EMBEDDING_DIMENSION):
+        self.name = name
+        self.embedding_fn = embedding_fn
+        self.dimension = dimension
+        self.dir = os.path.join(root_dir, name)
+        self.matrix_path = os.path.join(self.dir, "embeddings.f32")
+        self.records_path = os.path.join(self.dir, "records.json")
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict] = []
+        self._matrix = np.zeros((0, dimension), dtype=np.float32)
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.records_path):
+            return
+        with open(self.records_path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        self.dimension = records.get("dimension", self.dimension)
+        self._ids = records.get("ids", [])
+        self._documents = records.get("documents", [])
+        self._metadatas = records.get("metadatas", [])
+        if self._ids:
+            self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r",
+                                     shape=(len(self._ids), self.dimension))
+        else:
+            self._matrix = np.zeros((0, self.dimension), dtype=np.float32)
+
+    def _save(self, ids: List[str], documents: List[str], metadatas: List[Dict], matrix: np.ndarray) -> None:
+        os.makedirs(self.dir, exist_ok=True)
+        matrix_tmp = self.matrix_path + ".tmp"
+        records_tmp = self.records_path + ".tmp"
+        np.ascontiguousarray(matrix, dtype=np.float32).tofile(matrix_tmp)
+        with open(records_tmp, "w", encoding="utf-8") as f:
+            json.dump({"dimension": self.dimension, "ids": ids, "documents": documents, "metadatas": metadatas},
+                      f, ensure_ascii=False)
+        # 释放旧的映射后再替换文件（Windows 下被映射的文件无法覆盖）
+        self._matrix = np.zeros((0, self.dimension), dtype=np.float32)
+        os.replace(matrix_tmp, self.matrix_path)
+        os.replace(records_tmp, self.records_path)
+        self._load()
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def count(self) -> int:
+        return len(self._ids)
+
+    def ids(self) -> List[str]:
+        return list(self._ids)
+
+    def upsert(self, ids, documents, metadatas, embeddings=None) -> None:
+        if not ids:
+            return
+        if embeddings is None:
+            if self.embedding_fn is None:
+                raise ValueError(f"MmapVectorStore({self.name}) 需要 embedding_fn 才能写入文本")
+            embeddings = self.embedding_fn(list(documents))
+        new_rows = self._normalize(np.asarray(embeddings, dtype=np.float32))
+
+        all_ids = list(self._ids)
+        all_docs = list(self._documents)
+        all_metas = list(self._metadatas)
+        matrix = np.array(self._matrix, dtype=np.float32)
+        position = {doc_id: i for i, doc_id in enumerate(all_ids)}
+        appended = []
+        for row, (doc_id, doc, meta) in enumerate(zip(ids, documents, metadatas)):
+            if doc_id in position:
+                i = position[doc_id]
+                all_docs[i] = doc
+                all_metas[i] = meta
+                matrix[i] = new_rows[row]
+            else:
+                position[doc_id] = len(all_ids)
+                all_ids.append(doc_id)
+                all_docs.append(doc)
+                all_metas.append(meta)
+                appended.append(row)
+        if appended:
+            matrix = np.vstack([matrix, new_rows[appended]])
+        self._save(all_ids, all_docs, all_metas, matrix)
+
+    def delete(self, ids) -> None:
+        drop = set(ids)
+        keep = [i for i, doc_id in enumerate(self._ids) if doc_id not in drop]
+        if len(keep) == len(self._ids):
+            return
+        self._save(
+            [self._ids[i] for i in keep],
+            [self._documents[i] for i in keep],
+            [self._metadatas[i] for i in keep],
+            np.asarray(self._matrix)[keep]
+        )
+
+    def query(self, query_embeddings, n_results, include=None):
+        include = include or DEFAULT_INCLUDE
+        out: Dict[str, Any] = {"ids": []}
+        for key in ("documents", "metadatas", "distances"):
+            if key in include:
+                out[key] = []
+        n = len(self._ids)
+        queries = self._normalize(np.asarray(query_embeddings, dtype=np.float32))
+        scores = queries @ self._matrix.T if n else np.zeros((len(queries), 0), dtype=np.float32)
+        k = min(n_results, n)
+        for row in scores:
+            if k == 0:
+                top = np.array([], dtype=np.int64)
+            elif k < n:
+                top = np.argpartition(-row, k - 1)[:k]
+                top = top[np.argsort(-row[top])]
+            else:
+                top = np.argsort(-row)
+            out["ids"].append([self._ids[i] for i in top])
+            if "documents" in out:
+                out["documents"].append([self._documents[i] for i in top])
+            if "metadatas" in out:
+                out["metadatas"].append([self._metadatas[i] for i in top])
+            if "distances" in out:
+                out["distances"].append([float(1.0 - row[i]) for i in top])
+        return out
+
+
+def open_store(name: str, embedding_fn: Optional[Callable] = None, client=None,
+               backend: str = VECTOR_BACKEND) -> VectorStore:
+    if backend == "mmap":
+        return MmapVectorStore(VECTOR_STORE_DIR, name, embedding_fn)
+    if backend == "chroma":
+        if client is None:
+            import chromadb
+            os.makedirs(CHROMA_PATH, exist_ok=True)
+            client = chromadb.PersistentClient(path=CHROMA_PATH)
+        return ChromaVectorStore(client, name, embedding_fn)
+    raise ValueError(f"Unknown VECTOR_BACKEND: {backend}")